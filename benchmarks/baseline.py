@@ -0,0 +1,77 @@
+"""
+Baseline files for the benchmarks: save a run's summary and compare later
+runs against it. A run that is slower than the baseline by more than the
+tolerance is a regression.
+
+Baselines are machine-specific, so CI records its own on the same runner:
+check out the base commit, run the benchmark with --save-baseline, then
+check out the change and run it again to compare. A missing baseline fails
+the comparison, so a misconfigured job can't pass by skipping it; pass
+--allow-missing-baseline for an ad-hoc run with nothing to compare against.
+"""
+import json
+import os
+
+# A sub-millisecond p95 can double on scheduler noise alone; ignore moves smaller than these
+MIN_REGRESSION_MS = 0.5
+MIN_REGRESSION_US = 1.0
+
+
+def save(path: str, summary: dict):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(summary, f, indent=2, sort_keys=True)
+    print(f"Baseline written to {path}")
+
+
+def load(path: str):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> list:
+    """Regression messages; empty when current is within tolerance of baseline"""
+    if current.get("config") != baseline.get("config"):
+        return [f"config differs from the baseline ({baseline.get('config')}); re-record it with --save-baseline"]
+
+    problems = []
+    base_rps, rps = baseline.get("throughput_rps"), current.get("throughput_rps")
+    if base_rps and rps is not None and rps < base_rps * (1 - tolerance):
+        problems.append(f"throughput {rps:.1f} req/s < baseline {base_rps:.1f} req/s")
+
+    for name, base in baseline.get("results", {}).items():
+        result = current.get("results", {}).get(name)
+        if result is None:
+            problems.append(f"{name}: missing from this run")
+            continue
+        for metric in ("p50_ms", "p95_ms", "p99_ms", "us_per_op"):
+            if metric not in base:
+                continue
+            limit = base[metric] * (1 + tolerance)
+            floor = MIN_REGRESSION_US if metric == "us_per_op" else MIN_REGRESSION_MS
+            if result[metric] > limit and result[metric] - base[metric] > floor:
+                problems.append(f"{name}: {metric} {result[metric]:.3f} > baseline {base[metric]:.3f}")
+        if result.get("error_rate", 0) > base.get("error_rate", 0) + 0.01:
+            problems.append(f"{name}: error rate {result['error_rate']:.2%} > baseline {base.get('error_rate', 0):.2%}")
+    return problems
+
+
+def check(summary: dict, path: str, tolerance: float, save_baseline: bool, allow_missing: bool = False) -> int:
+    """Save or compare, print the outcome and return a process exit code"""
+    if save_baseline:
+        save(path, summary)
+        return 0
+    baseline = load(path)
+    if baseline is None:
+        print(f"No baseline at {path}; record one with --save-baseline")
+        return 0 if allow_missing else 1
+    problems = compare(summary, baseline, tolerance)
+    if problems:
+        print(f"\nREGRESSION against {path} (tolerance {tolerance:.0%}):")
+        for problem in problems:
+            print(f"  !! {problem}")
+        return 1
+    print(f"\nWithin {tolerance:.0%} of baseline {path}")
+    return 0
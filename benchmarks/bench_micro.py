@@ -0,0 +1,91 @@
+"""
+Micro-benchmarks for the per-request CPU costs: response serialization,
+token decode and password hashing.
+
+    python -m benchmarks.bench_micro --save-baseline
+    python -m benchmarks.bench_micro                  # exits 1 on a regression or no baseline
+"""
+import argparse
+import sys
+import timeit
+
+from benchmarks import baseline, stand_in
+
+DEFAULT_BASELINE = "benchmarks/baselines/micro.json"
+
+
+def measure(fn, number: int, repeat: int = 5) -> float:
+    """Best-of-`repeat` microseconds per call; the minimum is the least noisy estimate"""
+    return min(timeit.repeat(fn, number=number, repeat=repeat)) / number * 1e6
+
+
+def cases(scale: float) -> dict:
+    """name -> (callable, calls per timing)"""
+    from typing import List
+    from pydantic import TypeAdapter
+    from benchmarks.bench_serialization import make_docs, pydantic_path, fast_path, cached_path
+    from main import Item
+    from utils import token_helper
+    from utils.password_helper import hash_password, verify_password
+    from utils.response_helper import dumps, item_view
+
+    docs = make_docs(100)
+    adapter = TypeAdapter(List[Item])
+    body = dumps([item_view(doc) for doc in docs])
+
+    token = token_helper.create_token({"sub": "bench", "role": "admin"})
+
+    def decode_uncached():
+        token_helper._verified_tokens.clear()
+        token_helper.decode_token(token)
+
+    hashed = hash_password(stand_in.BENCH_PASSWORD)
+
+    def n(calls):
+        return max(1, int(calls * scale))
+
+    return {
+        "serialize_pydantic_100": (lambda: pydantic_path(docs, adapter), n(200)),
+        "serialize_fast_100": (lambda: fast_path(docs), n(200)),
+        "serialize_cached_100": (lambda: cached_path(body), n(20000)),
+        "token_create": (lambda: token_helper.create_token({"sub": "bench", "role": "admin"}), n(2000)),
+        "token_decode_uncached": (decode_uncached, n(2000)),
+        "token_decode_cached": (lambda: token_helper.decode_token(token), n(20000)),
+        # bcrypt is slow on purpose; a handful of calls is enough
+        "password_hash": (lambda: hash_password(stand_in.BENCH_PASSWORD), n(3)),
+        "password_verify": (lambda: verify_password(stand_in.BENCH_PASSWORD, hashed), n(3)),
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=float, default=1.0, help="multiply the calls per timing")
+    parser.add_argument("--only", help="comma-separated case names")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="record this run as the baseline")
+    parser.add_argument("--allow-missing-baseline", action="store_true",
+                        help="exit 0 when there is no baseline to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown before failing")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    # Importing main builds the motor client; the fake keeps that offline
+    stand_in.install()
+    selected = cases(args.scale)
+    if args.only:
+        selected = {name: selected[name] for name in args.only.split(",")}
+
+    results = {}
+    for name, (fn, number) in selected.items():
+        results[name] = {"us_per_op": round(measure(fn, number), 3)}
+        print(f"  {name:<26} {results[name]['us_per_op']:>12.1f} us/op")
+
+    summary = {"config": {"scale": args.scale, "cases": sorted(selected)}, "results": results}
+    return baseline.check(summary, args.baseline, args.tolerance, args.save_baseline,
+                          args.allow_missing_baseline)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
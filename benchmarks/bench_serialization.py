@@ -0,0 +1,66 @@
+"""
+Compare the catalog response paths without a database:
+the old List[Item] response_model path against the trusted-projection fast path.
+
+    python -m benchmarks.bench_serialization
+"""
+import sys
+import timeit
+from typing import List
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+
+sys.path.insert(0, ".")
+from main import Item  # noqa: E402
+from utils.response_helper import FastJSONResponse, dumps, item_view  # noqa: E402
+
+
+def make_docs(n: int = 100) -> list:
+    return [
+        {
+            "brand": f"Brand{i}",
+            "name": f"Item {i}",
+            "price": 10.0 + i,
+            "quantity": i % 7,
+            "description": "A reasonably sized product description " * 3,
+            "in_stock": i % 7 > 0,
+            "created_by": "admin",
+        }
+        for i in range(n)
+    ]
+
+
+def pydantic_path(docs, adapter):
+    """Roughly what FastAPI does for response_model=List[Item]"""
+    validated = adapter.validate_python(docs)
+    return JSONResponse(jsonable_encoder(adapter.dump_python(validated))).body
+
+
+def fast_path(docs):
+    return FastJSONResponse(dumps([item_view(doc) for doc in docs])).body
+
+
+def cached_path(body):
+    """Cache hit: the encoded body is reused as-is"""
+    return FastJSONResponse(body).body
+
+
+def main(n: int = 100, number: int = 2000):
+    docs = make_docs(n)
+    adapter = TypeAdapter(List[Item])
+    body = dumps([item_view(doc) for doc in docs])
+    results = {
+        "pydantic response_model": timeit.timeit(lambda: pydantic_path(docs, adapter), number=number),
+        "fast path (miss)": timeit.timeit(lambda: fast_path(docs), number=number),
+        "fast path (cache hit)": timeit.timeit(lambda: cached_path(body), number=number),
+    }
+    baseline = results["pydantic response_model"]
+    print(f"{n} items x {number} responses")
+    for name, seconds in results.items():
+        print(f"  {name:<26} {seconds / number * 1e6:9.1f} us/response  {baseline / seconds:6.1f}x")
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+Oversell check for the hot-brand reservation ledger: many concurrent buyers
+and cart checkouts race for one item's stock, then the books are compared.
+A second round runs after an admin PUTs a new quantity while the ledger
+holds a claimed block; that quantity must stand as the new stock.
+
+A second ledger plays another worker that also held a block at the edit.
+Until its next flush it keeps selling that block on top of the admin's
+quantity: the known multi-worker window, reported and bounded here to the
+units it held.
+Exits 1 if more units were sold than existed or the records disagree.
+
+    python -m benchmarks.check_oversell
+    python -m benchmarks.check_oversell --stock 500 --buyers 1000 --checkouts 100
+"""
+import argparse
+import asyncio
+import random
+import sys
+
+from benchmarks import stand_in
+
+
+async def run(args) -> list:
+    import httpx
+    import main
+    from db.db import items_collection, purchases_collection
+    from utils.reservation_helper import ReservationLedger
+
+    usernames = await stand_in.seed(1, args.checkouts + 1, args.stock, args.seed)
+    seeded = stand_in.make_item(0, "", 0)
+    brand = seeded["brand"]
+    rng = random.Random(args.seed)
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with stand_in.running(main.app), httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        tokens = []
+        for username in usernames:
+            response = await client.post("/auth/token", data={"username": username, "password": stand_in.BENCH_PASSWORD})
+            response.raise_for_status()
+            tokens.append({"Authorization": f"Bearer {response.json()['access_token']}"})
+        admin, shoppers = tokens[0], tokens[1:]
+
+        response = await client.put(f"/reservations/hot/{brand}?enabled=true", headers=admin)
+        response.raise_for_status()
+
+        async def buy():
+            response = await client.post(f"/items/buy/{brand}")
+            return 1 if response.status_code == 200 else 0
+
+        async def checkout(headers):
+            await client.post(f"/cart/add?brand={brand}&quantity={rng.randint(1, 3)}", headers=headers)
+            response = await client.post("/cart/checkout", headers=headers)
+            return sum(r["status"] == "ok" for r in response.json().get("results", []))
+
+        async def race():
+            jobs = [buy() for _ in range(args.buyers)] + [checkout(h) for h in shoppers]
+            rng.shuffle(jobs)
+            return sum(await asyncio.gather(*jobs))
+
+        bought = await race()
+
+        # Restock, let one buy claim a block, then set the stock outright while it's held
+        response = await client.patch(f"/items/{brand}", json={"quantity": args.restock}, headers=admin)
+        response.raise_for_status()
+        before_edit = await buy()
+        peer = ReservationLedger(ledger_id="peer")
+        peer_taken, _ = await peer.take(brand, 1)
+        peer_held = sum(entry.available for entry in peer._entries.values())
+        edit = {field: seeded[field] for field in ("brand", "name", "price", "description")}
+        response = await client.put(f"/items/{brand}", json={**edit, "quantity": args.restock}, headers=admin)
+        response.raise_for_status()
+        # The peer hasn't flushed yet, so it sells from the block it held
+        stale, _ = await peer.take(brand, peer_held)
+        await peer.close()
+        rebought = await race()
+        response = await client.put(f"/reservations/hot/{brand}?enabled=false", headers=admin)
+        response.raise_for_status()
+    # Leaving the app context ran shutdown, which flushed and released the ledger
+
+    item = await items_collection.find_one({"brand": brand})
+    purchases = await purchases_collection.find_one({"brand": brand}) or {}
+    await stand_in.drop(args.mongo_uri)
+
+    remaining = item["quantity"]
+    recorded = purchases.get("quantity_sold", 0)
+    print(f"stock {args.stock}: {bought} units sold to {args.buyers} buyers and {len(shoppers)} checkouts")
+    print(f"admin set {args.restock} while held: {rebought} more sold, {remaining} left, "
+          f"{recorded} recorded in purchases")
+    print(f"another worker sold {stale} of the {peer_held} units it held past the edit "
+          f"(dropped at its flush: {peer.stats['dropped_units']})")
+
+    problems = []
+    if bought > args.stock:
+        problems.append(f"oversold: {bought} sold from {args.stock}")
+    if rebought > args.restock:
+        problems.append(f"oversold after the admin edit: {rebought} sold from {args.restock}")
+    if remaining < 0:
+        problems.append(f"quantity went negative: {remaining}")
+    if rebought + remaining != args.restock:
+        problems.append(f"sold {rebought} + remaining {remaining} != admin quantity {args.restock}")
+    if stale > peer_held or peer.stats["dropped_units"] != peer_held - stale:
+        problems.append(f"other worker sold {stale} and dropped {peer.stats['dropped_units']} "
+                        f"of the {peer_held} units it held")
+    total = bought + before_edit + peer_taken + stale + rebought
+    if recorded != total:
+        problems.append(f"purchases records {recorded}, clients were told {total}")
+    if item.get("reserved"):
+        problems.append(f"reservations left after shutdown: {item['reserved']}")
+    return problems
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stock", type=int, default=137)
+    parser.add_argument("--buyers", type=int, default=300, help="concurrent single-unit buys")
+    parser.add_argument("--checkouts", type=int, default=30, help="concurrent cart checkouts of 1-3 units")
+    parser.add_argument("--restock", type=int, default=40, help="quantity an admin sets for the second round")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--mongo-uri", help="local mongod instead of the in-memory fake")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    stand_in.install(args.mongo_uri)
+    problems = asyncio.run(run(args))
+    if problems:
+        print("OVERSELL CHECK FAILED:")
+        for problem in problems:
+            print(f"  !! {problem}")
+        return 1
+    print("OK: every unit sold exactly once")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,208 @@
+"""
+Replay the Dashboard's traffic mix against the app in-process at a fixed
+concurrency and report throughput and p50/p95/p99 per endpoint.
+
+    python -m benchmarks.load_test --save-baseline    # record a baseline on this machine
+    python -m benchmarks.load_test                    # compare; exits 1 on a regression or no baseline
+    python -m benchmarks.load_test --items 5000 --concurrency 32 --requests 5000
+    python -m benchmarks.load_test --mongo-uri mongodb://localhost:27017
+
+Baselines are machine-specific: record one before a change, compare after
+(see benchmarks/baseline.py for how CI does it).
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+
+from benchmarks import baseline, stand_in
+
+# Share of requests per Dashboard action (see fastapi-frontend/src/pages/Dashboard.js):
+# page loads fetch items, count and notifications; cart actions are user-driven
+TRAFFIC_MIX = {
+    "items": 30,
+    "items_count": 15,
+    "notifications": 15,
+    "cart": 15,
+    "cart_add": 10,
+    "buy": 10,
+    "checkout": 5,
+}
+DEFAULT_BASELINE = "benchmarks/baselines/load_test.json"
+
+
+def percentile(sorted_values: list, pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, round(pct / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def pick_brand(rng: random.Random, brands: list) -> str:
+    # Sales are skewed: 80% of traffic goes to the top 20% of the catalog
+    hot = max(1, len(brands) // 5)
+    if rng.random() < 0.8:
+        return brands[rng.randrange(hot)]
+    return brands[rng.randrange(len(brands))]
+
+
+class Session:
+    """One Dashboard user: its token and the ETags its browser would send back"""
+
+    def __init__(self, client, token: str, record):
+        self.client = client
+        self.headers = {"Authorization": f"Bearer {token}"}
+        self.etags: dict = {}
+        self.record = record
+
+    async def call(self, name: str, method: str, url: str, conditional: bool = False):
+        headers = dict(self.headers)
+        if conditional and url in self.etags:
+            headers["If-None-Match"] = self.etags[url]
+        started = time.perf_counter()
+        response = await self.client.request(method, url, headers=headers)
+        self.record(name, time.perf_counter() - started, response.status_code)
+        if conditional and "etag" in response.headers:
+            self.etags[url] = response.headers["etag"]
+        return response
+
+    async def run(self, op: str, brand: str):
+        if op == "items":
+            await self.call(op, "GET", "/items", conditional=True)
+        elif op == "items_count":
+            await self.call(op, "GET", "/items/count", conditional=True)
+        elif op == "notifications":
+            await self.call(op, "GET", "/notifications")
+        elif op == "cart":
+            await self.call(op, "GET", "/cart")
+        elif op == "cart_add":
+            await self.call(op, "POST", f"/cart/add?brand={brand}&quantity=1")
+        elif op == "buy":
+            await self.call(op, "POST", f"/items/buy/{brand}")
+        elif op == "checkout":
+            await self.call("cart_add", "POST", f"/cart/add?brand={brand}&quantity=1")
+            await self.call(op, "POST", "/cart/checkout")
+
+
+def summarize(latencies: dict, errors: dict, elapsed: float, config: dict) -> dict:
+    results = {}
+    total = 0
+    for name in sorted(latencies):
+        values = sorted(latencies[name])
+        total += len(values)
+        results[name] = {
+            "count": len(values),
+            "rps": round(len(values) / elapsed, 1),
+            "error_rate": round(errors.get(name, 0) / len(values), 4),
+            "p50_ms": round(percentile(values, 50) * 1000, 3),
+            "p95_ms": round(percentile(values, 95) * 1000, 3),
+            "p99_ms": round(percentile(values, 99) * 1000, 3),
+        }
+    return {"config": config, "throughput_rps": round(total / elapsed, 1), "results": results}
+
+
+def print_report(summary: dict):
+    config = summary["config"]
+    print(f"{config['backend']}: {config['items']} items, {config['concurrency']} concurrent users, "
+          f"{config['requests']} requests")
+    print(f"  {'endpoint':<15}{'count':>7}{'req/s':>9}{'errors':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for name, r in summary["results"].items():
+        print(f"  {name:<15}{r['count']:>7}{r['rps']:>9.1f}{r['error_rate']:>8.1%}"
+              f"{r['p50_ms']:>9.2f}{r['p95_ms']:>9.2f}{r['p99_ms']:>9.2f}")
+    print(f"  {'total':<15}{'':>7}{summary['throughput_rps']:>9.1f}")
+
+
+async def run(args) -> dict:
+    import httpx
+    import main
+
+    usernames = await stand_in.seed(args.items, args.concurrency, args.stock, args.seed)
+    brands = [stand_in.make_item(i, "", 0)["brand"] for i in range(args.items)]
+
+    rng = random.Random(args.seed)
+    ops = list(TRAFFIC_MIX)
+    plan = [
+        (op, pick_brand(rng, brands))
+        for op in rng.choices(ops, weights=[TRAFFIC_MIX[op] for op in ops], k=args.warmup + args.requests)
+    ]
+
+    latencies: dict = {}
+    errors: dict = {}
+    recording = False
+
+    def record(name: str, seconds: float, status: int):
+        if not recording:
+            return
+        latencies.setdefault(name, []).append(seconds)
+        if status >= 400:
+            errors[name] = errors.get(name, 0) + 1
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with stand_in.running(main.app), httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        sessions = []
+        for username in usernames:
+            response = await client.post("/auth/token", data={"username": username, "password": stand_in.BENCH_PASSWORD})
+            response.raise_for_status()
+            sessions.append(Session(client, response.json()["access_token"], record))
+
+        async def worker(session: Session, steps):
+            for op, brand in steps:
+                await session.run(op, brand)
+
+        async def phase(steps):
+            # Fixed concurrency: each user works through its share of the plan in order
+            await asyncio.gather(*(worker(s, steps[i::len(sessions)]) for i, s in enumerate(sessions)))
+
+        await phase(plan[:args.warmup])
+        recording = True
+        started = time.perf_counter()
+        await phase(plan[args.warmup:])
+        elapsed = time.perf_counter() - started
+    await stand_in.drop(args.mongo_uri)
+
+    config = {
+        "backend": args.backend,
+        "items": args.items,
+        "concurrency": args.concurrency,
+        "requests": args.requests,
+        "seed": args.seed,
+        "mix": TRAFFIC_MIX,
+    }
+    return summarize(latencies, errors, elapsed, config)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=1000, help="catalog size to seed")
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent Dashboard users")
+    parser.add_argument("--requests", type=int, default=3000, help="measured requests")
+    parser.add_argument("--warmup", type=int, default=300, help="requests before measuring")
+    parser.add_argument("--stock", type=int, default=1_000_000, help="units per item, so buys never run out")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--mongo-uri", help="local mongod instead of the in-memory fake")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="record this run as the baseline")
+    parser.add_argument("--allow-missing-baseline", action="store_true",
+                        help="exit 0 when there is no baseline to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown before failing")
+    parser.add_argument("--output", help="also write this run's summary as JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    args.backend = stand_in.install(args.mongo_uri)
+    summary = asyncio.run(run(args))
+    print_report(summary)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(summary, f, indent=2)
+    return baseline.check(summary, args.baseline, args.tolerance, args.save_baseline,
+                          args.allow_missing_baseline)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
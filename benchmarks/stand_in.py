@@ -0,0 +1,119 @@
+"""
+Database stand-in shared by the benchmarks. Call install() before anything
+imports main or db.db: the motor client is created at import time.
+
+- default: mongomock-motor, an in-memory motor-compatible fake
+  (pip install mongomock-motor). Good for comparing app-side changes;
+  it does not model Mongo's own latency, locking or indexes.
+- --mongo-uri: a local mongod. A throwaway bench_<id> database is
+  created and dropped, so an existing database is never touched.
+"""
+import os
+import random
+import sys
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime
+
+sys.path.insert(0, ".")
+
+BENCH_PASSWORD = "bench-pw"
+
+
+def install(mongo_uri: str = None) -> str:
+    """Point db.db at the stand-in; returns a label for reports"""
+    if mongo_uri:
+        os.environ["MONGO_URI"] = mongo_uri
+        os.environ["MONGO_DB_NAME"] = f"bench_{uuid.uuid4().hex[:8]}"
+        return "mongod"
+
+    try:
+        import mongomock.collection
+        from mongomock_motor import AsyncMongoMockClient, AsyncMongoMockCollection
+    except ImportError:
+        sys.exit("mongomock-motor is not installed; pip install mongomock-motor or pass --mongo-uri")
+    import motor.motor_asyncio
+
+    os.environ.setdefault("MONGO_DB_NAME", "bench")
+    # One in-memory server and no sessions: there are no secondaries to read from
+    os.environ.setdefault("CATALOG_READS_FROM_SECONDARIES", "0")
+    motor.motor_asyncio.AsyncIOMotorClient = lambda *args, **kwargs: AsyncMongoMockClient()
+
+    # Newer pymongo passes bulk update options mongomock doesn't know about
+    add_update = mongomock.collection.BulkOperationBuilder.add_update
+
+    def _add_update(self, selector, doc, multi=False, upsert=False, collation=None, array_filters=None,
+                    hint=None, **kwargs):
+        return add_update(self, selector, doc, multi, upsert, collation=collation,
+                          array_filters=array_filters, hint=hint)
+
+    mongomock.collection.BulkOperationBuilder.add_update = _add_update
+
+    # The fake hands with_options() to the sync collection, losing the async wrapper
+    def _with_options(self, **kwargs):
+        options = self._AsyncMongoMockCollection__collection.with_options(**kwargs)
+        return AsyncMongoMockCollection(self.database, options)
+
+    AsyncMongoMockCollection.with_options = _with_options
+    return "mongomock"
+
+
+def make_item(i: int, owner: str, quantity: int) -> dict:
+    from utils.brand_helper import normalize_brand
+
+    brand = f"Brand{i:05d}"
+    return {
+        "id": str(uuid.uuid4()),
+        "brand": brand,
+        "brand_key": normalize_brand(brand),
+        "name": f"Item {i}",
+        "price": round(5 + (i * 7.3) % 200, 2),
+        "quantity": quantity,
+        "description": "Benchmark item with a description of typical length " * 2,
+        "in_stock": quantity > 0,
+        "created_by": owner,
+        "updated_at": datetime.utcnow(),
+    }
+
+
+async def seed(items: int, users: int, stock: int, rng_seed: int = 0) -> list:
+    """
+    Fresh catalog of `items` brands owned by `users` admins, written straight
+    to the collections (the API caps items per admin). Returns the usernames;
+    every account's password is BENCH_PASSWORD.
+    """
+    from db.db import db, items_collection, users_collection
+    from utils.inventory_helper import reconcile_inventory_stats
+    from utils.password_helper import hash_password
+
+    for name in await db.list_collection_names():
+        await db[name].delete_many({})
+
+    rng = random.Random(rng_seed)
+    usernames = [f"bench_admin_{n}" for n in range(users)]
+    # bcrypt is deliberately slow; one hash serves every seeded account
+    hashed = hash_password(BENCH_PASSWORD)
+    await users_collection.insert_many([
+        {"id": str(uuid.uuid4()), "username": username, "hashed_password": hashed, "role": "admin"}
+        for username in usernames
+    ])
+    docs = [make_item(i, rng.choice(usernames), stock) for i in range(items)]
+    for start in range(0, len(docs), 1000):
+        await items_collection.insert_many(docs[start:start + 1000])
+    await reconcile_inventory_stats()
+    return usernames
+
+
+async def drop(mongo_uri: str = None):
+    """Remove the throwaway database created for a mongod run"""
+    if mongo_uri:
+        from db.db import client, MONGO_DB_NAME
+
+        await client.drop_database(MONGO_DB_NAME)
+
+
+@asynccontextmanager
+async def running(app):
+    """Run the app's startup and shutdown handlers around a benchmark"""
+    async with app.router.lifespan_context(app):
+        yield
@@ -1,6 +1,8 @@
 import motor.motor_asyncio
 from dotenv import load_dotenv
+from pymongo.read_preferences import SecondaryPreferred
 import os
+from utils.metrics import MongoCommandMetrics, MongoPoolMetrics
 
 
 load_dotenv()
@@ -8,16 +10,33 @@ load_dotenv()
 MONGO_URI = os.getenv("MONGO_URI")
 MONGO_DB_NAME = os.getenv("MONGO_DB_NAME")
 
-# Optimized connection pool settings
+# Connection pool settings; size the pool per worker process
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", 10))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", 5))
+MONGO_MAX_CONNECTING = int(os.getenv("MONGO_MAX_CONNECTING", 2))  # connections opened in parallel
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", 30000))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", 10000))
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", 45000))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", 5000))
+
+# Catalog reads (lists, search, sold counts) may go to secondaries lagging by at most
+# this many seconds; 90 is the smallest value Mongo accepts
+CATALOG_READS_FROM_SECONDARIES = os.getenv("CATALOG_READS_FROM_SECONDARIES", "1") != "0"
+CATALOG_MAX_STALENESS_SECONDS = max(90, int(os.getenv("CATALOG_MAX_STALENESS_SECONDS", 90)))
+
 client = motor.motor_asyncio.AsyncIOMotorClient(
     MONGO_URI,
-    maxPoolSize=10,  # Maximum number of connections in the connection pool
-    minPoolSize=5,   # Minimum number of connections in the connection pool
-    maxIdleTimeMS=30000,  # Close connections after 30 seconds of inactivity
-    serverSelectionTimeoutMS=5000,  # Keep trying to send operations for 5 seconds
-    connectTimeoutMS=10000,  # Give up initial connection after 10 seconds
-    socketTimeoutMS=45000,  # Close sockets after 45 seconds of inactivity
-    waitQueueTimeoutMS=5000,  # Wait 5 seconds for a connection from the pool
+    maxPoolSize=MONGO_MAX_POOL_SIZE,
+    minPoolSize=MONGO_MIN_POOL_SIZE,
+    maxConnecting=MONGO_MAX_CONNECTING,
+    maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+    serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+    connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+    socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS,
+    waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+    # Command latency and pool checkout wait for /metrics
+    event_listeners=[MongoCommandMetrics(), MongoPoolMetrics()],
 )
 db = client[MONGO_DB_NAME]
 
@@ -30,6 +49,22 @@ updated_items_collection = db["updated_items"]
 deleted_items_collection = db["deleted_items"]
 carts_collection = db["carts"]
 payments_collection = db["payments"]
+inventory_stats_collection = db["inventory_stats"]
+migrations_collection = db["migrations"]
+sales_buckets_collection = db["sales_buckets"]
+
+
+def catalog_reads(collection):
+    """Same collection, read from a secondary when one is fresh enough; writes still go to the primary"""
+    if not CATALOG_READS_FROM_SECONDARIES:
+        return collection
+    return collection.with_options(read_preference=SecondaryPreferred(max_staleness=CATALOG_MAX_STALENESS_SECONDS))
+
+
+catalog_items_collection = catalog_reads(items_collection)
+catalog_purchases_collection = catalog_reads(purchases_collection)
+catalog_stats_collection = catalog_reads(inventory_stats_collection)
+
 
 async def check_mongo_connection():
     try:
@@ -41,22 +76,19 @@ async def check_mongo_connection():
         print(f" MongoDB connection failed: {e}")
 
 async def create_indexes():
-    """Create database indexes for optimized queries"""
-    try:
-        # Items collection indexes
-        await items_collection.create_index([("brand", 1)], unique=True)
-        await items_collection.create_index([("name", 1)])
-        await items_collection.create_index([("in_stock", 1)])
-        await items_collection.create_index([("created_by", 1)])
-        await items_collection.create_index([("brand", 1), ("name", 1)])
-
-        # Users collection indexes
-        await users_collection.create_index([("username", 1)], unique=True)
-        await users_collection.create_index([("email", 1)])
+    """Bring indexes in line with the manifest in db/indexes.py"""
+    from db.indexes import ensure_indexes
 
-        # Search optimization indexes
-        await items_collection.create_index([("$**", "text")])
-
-        print("Database indexes created successfully")
+    try:
+        report = await ensure_indexes()
+        if report["skipped"]:
+            print(f"Database indexes up to date (manifest {report['version']})")
+            return
+        for name, result in report["collections"].items():
+            if any(result.values()):
+                print(f"Indexes on {name}: created {result['created']}, modified {result['modified']}, "
+                      f"rebuilt {result['rebuilt']}, dropped {result['dropped']}")
+        for name, error in report["errors"].items():
+            print(f"Index creation error on {name}: {error}")
     except Exception as e:
         print(f"Index creation error: {e}")
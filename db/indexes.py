@@ -0,0 +1,236 @@
+import asyncio
+import hashlib
+import json
+import os
+from datetime import datetime
+from pymongo import IndexModel, ASCENDING, DESCENDING, TEXT
+from db.db import db, migrations_collection
+
+# Notifications not touched for this long are removed by Mongo's TTL monitor
+NOTIFICATION_TTL_SECONDS = int(os.getenv("NOTIFICATION_TTL_SECONDS", 7 * 24 * 3600))
+
+# Every index the application relies on, per collection. Changing this
+# manifest changes its version, which makes the next boot diff and build.
+INDEX_MANIFEST = {
+    "items": [
+        {"keys": [("brand", ASCENDING)], "unique": True},
+        {"keys": [("name", ASCENDING)]},
+        {"keys": [("in_stock", ASCENDING)]},
+        {"keys": [("created_by", ASCENDING)]},
+        {"keys": [("brand", ASCENDING), ("name", ASCENDING)]},
+        # Normalized brand key for case-insensitive exact lookups
+        {"keys": [("brand_key", ASCENDING)], "unique": True,
+         "partialFilterExpression": {"brand_key": {"$exists": True}}},
+        # (field, brand) pairs back keyset pagination on /items/paged
+        {"keys": [("name", ASCENDING), ("brand", ASCENDING)]},
+        {"keys": [("price", ASCENDING), ("brand", ASCENDING)]},
+        {"keys": [("quantity", ASCENDING), ("brand", ASCENDING)]},
+        # Full-text fallback for /items/search; typeahead uses the in-process index
+        {"keys": [("brand", TEXT), ("name", TEXT), ("description", TEXT)], "name": "items_text",
+         "weights": {"brand": 10, "name": 5, "description": 1}},
+        # Image GC reads the referenced ids with distinct()
+        {"keys": [("image_id", ASCENDING)]},
+    ],
+    "users": [
+        {"keys": [("username", ASCENDING)], "unique": True},
+        {"keys": [("email", ASCENDING)]},
+    ],
+    "notifications": [
+        {"keys": [("created_by", ASCENDING), ("notified_at", DESCENDING)]},
+        # Coalescing upserts look up the open entry for (owner, brand, level)
+        {"keys": [("created_by", ASCENDING), ("brand_key", ASCENDING), ("level", ASCENDING)]},
+        {"keys": [("notified_at", ASCENDING)], "expireAfterSeconds": NOTIFICATION_TTL_SECONDS},
+    ],
+    "purchases": [
+        {"keys": [("brand_key", ASCENDING)]},
+    ],
+    "sales_buckets": [
+        {"keys": [("granularity", ASCENDING), ("brand_key", ASCENDING), ("start", ASCENDING)], "unique": True},
+        # Range reads across every brand
+        {"keys": [("granularity", ASCENDING), ("start", ASCENDING)]},
+    ],
+    "carts": [
+        {"keys": [("username", ASCENDING), ("items.brand_key", ASCENDING)]},
+    ],
+    "payments": [
+        {"keys": [("username", ASCENDING), ("created_at", DESCENDING)]},
+        {"keys": [("created_at", DESCENDING)]},
+    ],
+    "deleted_items": [
+        {"keys": [("deleted_at", DESCENDING)]},
+        {"keys": [("image_id", ASCENDING)]},
+    ],
+}
+
+# Indexes replaced by the manifest; dropped when found
+OBSOLETE_INDEXES = {
+    # Wildcard text index: costly on every write, superseded by items_text
+    "items": ["$**_text"],
+}
+
+
+def query_shapes() -> list:
+    """
+    Representative query shapes, checked with explain(). Filters come from the
+    helpers that build them, so they match what is issued right now (brand_filter
+    is the legacy $or until the brand_key backfill finishes). A new query on a
+    hot path must be registered here.
+    """
+    from utils.brand_helper import brand_filter
+    from utils.notification_helper import coalesce_filter, stock_level
+
+    return [
+        ("items", brand_filter("x"), None),
+        ("items", {"created_by": "x"}, None),
+        ("items", {"in_stock": True}, None),
+        ("items", {}, [("name", ASCENDING), ("brand", ASCENDING)]),
+        ("items", {}, [("price", ASCENDING), ("brand", ASCENDING)]),
+        ("items", {}, [("quantity", ASCENDING), ("brand", ASCENDING)]),
+        # distinct("image_id") in image GC walks this index
+        ("items", {}, [("image_id", ASCENDING)]),
+        ("users", {"username": "x"}, None),
+        ("notifications", {"created_by": "x"}, [("notified_at", DESCENDING)]),
+        ("notifications", coalesce_filter("x", "x", stock_level(1), datetime(2000, 1, 1)), None),
+        ("purchases", brand_filter("x"), None),
+        ("carts", {"username": "x"}, None),
+        ("sales_buckets", {"granularity": "hour", "brand_key": "x", "start": {"$gte": datetime(2000, 1, 1)}}, None),
+        ("payments", {"username": "x"}, [("created_at", DESCENDING)]),
+        ("deleted_items", {}, [("image_id", ASCENDING)]),
+    ]
+
+
+MANIFEST_STATE_ID = "index_manifest"
+
+
+def _models(specs):
+    models = []
+    for spec in specs:
+        options = {k: v for k, v in spec.items() if k != "keys"}
+        models.append(IndexModel(spec["keys"], **options))
+    return models
+
+
+def manifest_version() -> str:
+    """Stable hash of the manifest and obsolete list"""
+    raw = json.dumps({"indexes": INDEX_MANIFEST, "obsolete": OBSOLETE_INDEXES}, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()[:16]
+
+
+# Index options that change behaviour; a manifest index whose existing
+# counterpart differs in any of them (or in its keys) is brought in line
+_COMPARED_OPTIONS = ("unique", "sparse", "partialFilterExpression", "expireAfterSeconds", "weights")
+
+
+def _definition(index: dict) -> dict:
+    """Keys plus compared options, normalized so manifest and list_indexes() entries compare equal"""
+    key = dict(index["key"])
+    if "_fts" in key or "text" in key.values():
+        # Stored text keys are _fts/_ftsx; the indexed fields live in weights
+        key = {"text": "text"}
+    definition = {"key": [(field, direction if isinstance(direction, str) else int(direction))
+                          for field, direction in key.items()]}
+    for option in _COMPARED_OPTIONS:
+        value = index.get(option)
+        if option in ("unique", "sparse"):
+            value = bool(value)
+        elif option == "weights" and value is not None:
+            value = {field: int(weight) for field, weight in value.items()}
+        definition[option] = value
+    return definition
+
+
+async def _sync_collection(name: str, specs) -> dict:
+    """Build whatever the manifest lists that the collection lacks, and fix indexes whose definition drifted"""
+    collection = db[name]
+    existing = {index["name"]: index async for index in collection.list_indexes()}
+    dropped, modified, rebuilt = [], [], []
+    for index_name in OBSOLETE_INDEXES.get(name, []):
+        if index_name in existing:
+            await collection.drop_index(index_name)
+            dropped.append(index_name)
+    missing = []
+    for model in _models(specs):
+        wanted = model.document
+        current = existing.get(wanted["name"])
+        if current is None:
+            missing.append(model)
+            continue
+        want, have = _definition(wanted), _definition(current)
+        if want == have:
+            continue
+        if {**have, "expireAfterSeconds": want["expireAfterSeconds"]} == want and have["expireAfterSeconds"] is not None:
+            # Only the TTL changed: collMod updates it in place, no rebuild
+            await db.command("collMod", name, index={
+                "name": wanted["name"], "expireAfterSeconds": want["expireAfterSeconds"]
+            })
+            modified.append(wanted["name"])
+            continue
+        await collection.drop_index(wanted["name"])
+        missing.append(model)
+        rebuilt.append(wanted["name"])
+    if missing:
+        await collection.create_indexes(missing)
+    return {
+        "created": [model.document["name"] for model in missing if model.document["name"] not in rebuilt],
+        "modified": modified,
+        "rebuilt": rebuilt,
+        "dropped": dropped,
+    }
+
+
+async def ensure_indexes(force: bool = False) -> dict:
+    """
+    Diff the manifest against list_indexes() and build only what is missing or
+    defined differently, all collections concurrently. Skipped when this
+    manifest version is recorded.
+    """
+    version = manifest_version()
+    state = await migrations_collection.find_one({"_id": MANIFEST_STATE_ID})
+    if state and state.get("version") == version and not force:
+        return {"version": version, "skipped": True}
+
+    names = list(INDEX_MANIFEST)
+    results = await asyncio.gather(
+        *(_sync_collection(name, INDEX_MANIFEST[name]) for name in names), return_exceptions=True
+    )
+    report = {"version": version, "skipped": False, "collections": {}, "errors": {}}
+    for name, result in zip(names, results):
+        if isinstance(result, Exception):
+            report["errors"][name] = str(result)
+        else:
+            report["collections"][name] = result
+
+    # Only record the version once everything built, so a failure is retried next boot
+    if not report["errors"]:
+        await migrations_collection.update_one(
+            {"_id": MANIFEST_STATE_ID},
+            {"$set": {"version": version, "applied_at": datetime.utcnow()}},
+            upsert=True,
+        )
+    return report
+
+
+def _plan_stages(plan):
+    if not isinstance(plan, dict):
+        return
+    if "stage" in plan:
+        yield plan["stage"]
+    for key in ("inputStage", "queryPlan"):
+        yield from _plan_stages(plan.get(key))
+    for child in plan.get("inputStages", []):
+        yield from _plan_stages(child)
+
+
+async def report_unindexed_queries() -> list:
+    """Query shapes whose winning plan still does a collection scan or in-memory sort"""
+    findings = []
+    for name, query, sort in query_shapes():
+        cursor = db[name].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        explain = await cursor.explain()
+        stages = set(_plan_stages(explain.get("queryPlanner", {}).get("winningPlan", {})))
+        problems = sorted(stages & {"COLLSCAN", "SORT"})
+        if problems:
+            findings.append({"collection": name, "filter": query, "sort": sort, "stages": problems})
+    return findings
@@ -0,0 +1,216 @@
+import asyncio
+import os
+import socket
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from pymongo import UpdateOne, ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from db.db import items_collection, purchases_collection, carts_collection, migrations_collection
+from utils.brand_helper import normalize_brand, set_brand_keys_ready
+
+BATCH_SIZE = 500
+# A runner that stops renewing its lease for this long is presumed dead
+MIGRATION_LEASE_SECONDS = int(os.getenv("MIGRATION_LEASE_SECONDS", 60))
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+async def _flush(collection, ops):
+    """Write one batch; duplicate keys are reported, not fatal"""
+    if not ops:
+        return 0
+    try:
+        result = await collection.bulk_write(ops, ordered=False)
+        return result.modified_count
+    except BulkWriteError as e:
+        for err in e.details.get("writeErrors", []):
+            print(f"brand_key backfill skipped a document in {collection.name}: {err.get('errmsg')}")
+        return e.details.get("nModified", 0)
+
+
+async def _backfill_flat(collection, batch_size):
+    """Set brand_key on documents that have a top-level brand"""
+    modified = 0
+    ops = []
+    cursor = collection.find({"brand_key": {"$exists": False}, "brand": {"$type": "string"}}, {"brand": 1})
+    async for doc in cursor.batch_size(batch_size):
+        # Keep brand in the filter so a concurrent rename is not overwritten
+        ops.append(UpdateOne(
+            {"_id": doc["_id"], "brand": doc["brand"]},
+            {"$set": {"brand_key": normalize_brand(doc["brand"])}}
+        ))
+        if len(ops) >= batch_size:
+            modified += await _flush(collection, ops)
+            ops = []
+    modified += await _flush(collection, ops)
+    return modified
+
+
+async def _backfill_carts(batch_size):
+    """Set brand_key on every cart line that is missing one"""
+    modified = 0
+    ops = []
+    cursor = carts_collection.find({"items": {"$elemMatch": {"brand_key": {"$exists": False}}}}, {"items.brand": 1})
+    async for cart in cursor.batch_size(batch_size):
+        for brand in {line.get("brand") for line in cart.get("items", []) if line.get("brand")}:
+            # arrayFilters touch only the matching lines, so concurrent cart edits survive
+            ops.append(UpdateOne(
+                {"_id": cart["_id"]},
+                {"$set": {"items.$[line].brand_key": normalize_brand(brand)}},
+                array_filters=[{"line.brand": brand, "line.brand_key": {"$exists": False}}]
+            ))
+        if len(ops) >= batch_size:
+            modified += await _flush(carts_collection, ops)
+            ops = []
+    modified += await _flush(carts_collection, ops)
+    return modified
+
+
+async def backfill_brand_keys(batch_size: int = BATCH_SIZE):
+    """
+    Online migration: add brand_key to existing items, purchases and carts.
+    Lookups keep a case-insensitive fallback until this has finished.
+    """
+    try:
+        items = await _backfill_flat(items_collection, batch_size)
+        purchases = await _backfill_flat(purchases_collection, batch_size)
+        carts = await _backfill_carts(batch_size)
+        if items or purchases or carts:
+            print(f"brand_key backfill: {items} items, {purchases} purchases, {carts} carts")
+        # Documents skipped for duplicate keys still need the fallback
+        for collection in (items_collection, purchases_collection):
+            if await collection.find_one({"brand_key": {"$exists": False}}, {"_id": 1}):
+                return
+        if await carts_collection.find_one({"items": {"$elemMatch": {"brand_key": {"$exists": False}}}}, {"_id": 1}):
+            return
+        set_brand_keys_ready()
+    except Exception as e:
+        print(f"brand_key backfill error: {e}")
+
+
+# ---------------- RESUMABLE MIGRATIONS ----------------
+async def _acquire_lease(name: str, runner: str):
+    """
+    Claim the single-runner lease for a migration.
+    Returns its status document, or None if it is done or held by another worker.
+    """
+    now = datetime.utcnow()
+    try:
+        return await migrations_collection.find_one_and_update(
+            {
+                "_id": name,
+                "status": {"$ne": "done"},
+                "$or": [{"locked_until": {"$lt": now}}, {"locked_until": {"$exists": False}}],
+            },
+            {
+                "$set": {
+                    "status": "running",
+                    "locked_by": runner,
+                    "locked_until": now + timedelta(seconds=MIGRATION_LEASE_SECONDS),
+                },
+                "$setOnInsert": {"processed": 0, "last_id": None, "started_at": now},
+            },
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+    except DuplicateKeyError:
+        # The document exists but did not match: finished, or another worker holds the lease
+        return None
+
+
+async def _checkpoint(name: str, runner: str, **fields):
+    """Record progress and renew the lease"""
+    now = datetime.utcnow()
+    await migrations_collection.update_one(
+        {"_id": name, "locked_by": runner},
+        {"$set": {**fields, "updated_at": now, "locked_until": now + timedelta(seconds=MIGRATION_LEASE_SECONDS)}},
+    )
+
+
+@asynccontextmanager
+async def single_runner(name: str):
+    """
+    Lease for a recurring job that every worker schedules. Yields a coroutine
+    function that renews the lease in the one worker holding it, None in the
+    rest; the lease is handed back when the block exits.
+    """
+    runner = f"{WORKER_ID}:{uuid.uuid4().hex[:8]}"
+    state = await _acquire_lease(name, runner)
+    if state is None:
+        yield None
+        return
+
+    async def renew():
+        await _checkpoint(name, runner)
+
+    try:
+        yield renew
+    finally:
+        await migrations_collection.update_one(
+            {"_id": name, "locked_by": runner},
+            {"$set": {"status": "idle", "finished_at": datetime.utcnow()}, "$unset": {"locked_until": ""}},
+        )
+
+
+MISSING_ID = {"$or": [{"id": {"$exists": False}}, {"id": None}, {"id": ""}]}
+
+
+async def backfill_item_ids(batch_size: int = BATCH_SIZE):
+    """
+    Give every item without an 'id' a UUID, in _id order and batched.
+    Progress is checkpointed, so a restarted worker resumes where it stopped,
+    and a lease keeps other workers from running it at the same time. A
+    finished run is started over when id-less items turn up again.
+    """
+    name = "item_uuid_backfill"
+    runner = f"{WORKER_ID}:{uuid.uuid4().hex[:8]}"
+    try:
+        # Items written without an id after it finished (restores, old clients) re-open it
+        if await items_collection.find_one(MISSING_ID, {"_id": 1}):
+            await migrations_collection.update_one(
+                {"_id": name, "status": "done"},
+                {"$set": {"status": "pending", "last_id": None}, "$unset": {"locked_until": ""}},
+            )
+        state = await _acquire_lease(name, runner)
+        if state is None:
+            return
+        last_id = state.get("last_id")
+        processed = state.get("processed", 0)
+        while True:
+            query = dict(MISSING_ID)
+            if last_id is not None:
+                query = {"$and": [MISSING_ID, {"_id": {"$gt": last_id}}]}
+            batch = await items_collection.find(query, {"_id": 1}).sort("_id", 1).limit(batch_size).to_list(length=batch_size)
+            if not batch:
+                break
+            await items_collection.bulk_write(
+                [
+                    # Re-check the filter so an id written meanwhile is not replaced
+                    UpdateOne({"$and": [MISSING_ID, {"_id": doc["_id"]}]}, {"$set": {"id": str(uuid.uuid4())}})
+                    for doc in batch
+                ],
+                ordered=False,
+            )
+            last_id = batch[-1]["_id"]
+            processed += len(batch)
+            await _checkpoint(name, runner, last_id=last_id, processed=processed)
+            # Yield between batches so request handling is not starved
+            await asyncio.sleep(0)
+        await _checkpoint(name, runner, status="done", finished_at=datetime.utcnow(), processed=processed)
+        if processed:
+            print(f"UUID backfill: assigned ids to {processed} items")
+    except Exception as e:
+        print(f"UUID backfill error: {e}")
+        await migrations_collection.update_one(
+            {"_id": name, "locked_by": runner},
+            {"$set": {"status": "failed", "error": str(e), "locked_until": datetime.utcnow()}},
+        )
+
+
+async def migration_status():
+    """Status documents of every resumable migration"""
+    migrations = await migrations_collection.find({}).to_list(length=100)
+    for migration in migrations:
+        if migration.get("last_id") is not None:
+            migration["last_id"] = str(migration["last_id"])
+    return migrations
@@ -1,5 +1,6 @@
-import React, { useState, useEffect, useCallback, Suspense } from "react";
+import React, { useState, useEffect, useCallback, useRef, Suspense } from "react";
 import API from "../api";
+import LazyImage from "../components/LazyImage";
 
 // Lazy load heavy components
 const StatsCards = React.lazy(() => import("../components/StatsCards"));
@@ -19,6 +20,7 @@ export default function Dashboard() {
   const [refreshCountdown, setRefreshCountdown] = useState(30);
   const [message, setMessage] = useState({ text: "", type: "", show: false });
   const [userRole, setUserRole] = useState("");
+  const streamConnected = useRef(false);
 
   // Search
   const [searchQuery, setSearchQuery] = useState("");
@@ -111,9 +113,9 @@ export default function Dashboard() {
 
   const addToCart = async (brand, quantity = 1) => {
     try {
-      await API.post(`/cart/add?brand=${encodeURIComponent(brand)}&quantity=${quantity}`);
-      await fetchCart();
-      await fetchData(); // refresh inventory after adding
+      // Adding to the cart doesn't reserve stock, so the inventory is unchanged
+      const res = await API.post(`/cart/add?brand=${encodeURIComponent(brand)}&quantity=${quantity}`);
+      setCart(res.data.cart);
       showMessage(`Added ${brand} to cart`);
       setIsCartOpen(true);
     } catch (error) {
@@ -124,9 +126,8 @@ export default function Dashboard() {
 
   const updateCartQty = async (brand, quantity) => {
     try {
-      await API.post(`/cart/update?brand=${encodeURIComponent(brand)}&quantity=${quantity}`);
-      await fetchCart();
-      await fetchData(); // refresh inventory after updating cart
+      const res = await API.post(`/cart/update?brand=${encodeURIComponent(brand)}&quantity=${quantity}`);
+      setCart(res.data.cart);
     } catch (error) {
       console.error("Error updating cart:", error);
       showMessage(error.response?.data?.detail || "Error updating cart", "error");
@@ -135,8 +136,8 @@ export default function Dashboard() {
 
   const clearCart = async () => {
     try {
-      await API.post("/cart/clear");
-      await fetchCart();
+      const res = await API.post("/cart/clear");
+      setCart(res.data.cart);
       showMessage("Cart cleared");
     } catch (error) {
       console.error("Error clearing cart:", error);
@@ -269,7 +270,8 @@ export default function Dashboard() {
     const interval = setInterval(() => {
       setRefreshCountdown((prev) => {
         if (prev <= 1) {
-          fetchNotificationsOnly();
+          // Polling is only the fallback while the live stream is down
+          if (!streamConnected.current) fetchNotificationsOnly();
           return 30;
         }
         return prev - 1;
@@ -279,6 +281,33 @@ export default function Dashboard() {
     return () => clearInterval(interval);
   }, [fetchData, fetchCart, fetchRole, fetchNotificationsOnly]);
 
+  // Live notifications over Server-Sent Events (admins only)
+  useEffect(() => {
+    if (userRole !== "admin" && userRole !== "superadmin") return;
+    const token = localStorage.getItem("token");
+    if (!token || typeof EventSource === "undefined") return;
+
+    const url = `${API.defaults.baseURL}/notifications/stream?token=${encodeURIComponent(token)}`;
+    const source = new EventSource(url);
+    source.onopen = () => {
+      streamConnected.current = true;
+    };
+    source.onerror = () => {
+      // EventSource reconnects by itself and resumes from the last event id
+      streamConnected.current = false;
+    };
+    source.addEventListener("notification", (event) => {
+      const notification = JSON.parse(event.data);
+      // Coalesced notifications are updated in place; replace the older copy
+      setNotifications((prev) => [notification, ...prev.filter((n) => n.id !== notification.id)]);
+    });
+
+    return () => {
+      streamConnected.current = false;
+      source.close();
+    };
+  }, [userRole]);
+
   // Form helpers
   const openEditForm = (item) => {
     setEditingItem(item);
@@ -531,7 +560,18 @@ export default function Dashboard() {
               <tbody>
                 {items.map((item, index) => (
                   <tr key={index} className="border-b hover:bg-gray-50">
-                    <td className="p-3 font-semibold">{item.brand}</td>
+                    <td className="p-3 font-semibold">
+                      <div className="flex items-center gap-3">
+                        {item.image_id && (
+                          <LazyImage
+                            src={`${API.defaults.baseURL}/images/${item.image_id}?w=64&h=64&fmt=webp`}
+                            alt={item.name}
+                            className="w-12 h-12"
+                          />
+                        )}
+                        {item.brand}
+                      </div>
+                    </td>
                     <td className="p-3">{item.name}</td>
                     <td className="p-3">${item.price}</td>
                     <td className="p-3">{item.quantity}</td>
@@ -1,11 +1,14 @@
-from fastapi import FastAPI, HTTPException, Depends, File, UploadFile
+from fastapi import FastAPI, HTTPException, Depends, File, UploadFile, Request, Response, Query
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi.staticfiles import StaticFiles
+from fastapi.responses import StreamingResponse, FileResponse
 from pydantic import BaseModel
 from typing import List, Optional
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 import uuid
 import os
+import re
+import asyncio
 from fastapi.middleware.cors import CORSMiddleware
 from pymongo import ReturnDocument
 from db.db import (
@@ -18,12 +21,96 @@ from db.db import (
     deleted_items_collection,
     carts_collection,
     payments_collection,
+    catalog_items_collection,
+    catalog_purchases_collection,
+    MONGO_MAX_POOL_SIZE,
+    MONGO_MIN_POOL_SIZE,
+    MONGO_MAX_CONNECTING,
+    MONGO_WAIT_QUEUE_TIMEOUT_MS,
+    CATALOG_READS_FROM_SECONDARIES,
+    CATALOG_MAX_STALENESS_SECONDS,
 )
 from utils.token_helper import create_token, decode_token
-from utils.password_helper import hash_password, verify_password
-from utils.search_helper import mongo_text_search
+from utils.auth_cache import get_principal, auth_cache_stats
+from utils.password_helper import (
+    hash_password_async,
+    verify_password_async,
+    password_pool_stats,
+    PasswordPoolBusy,
+)
+from utils.search_helper import mongo_text_search, item_search_index, maintain_search_index, suggest_items
+from utils.checkout_helper import bulk_checkout
+from utils.reservation_helper import (
+    reservation_ledger, maintain_reservations, release_expired_reservations, RESET_RESERVATIONS
+)
+from utils.sales_helper import SALES_GRANULARITIES, record_sales, rollup_sales, maintain_sales_rollups, query_sales
+from utils.image_helper import (
+    ingest_image, shutdown_image_pool, ImagePoolBusy, InvalidImage, ImageTooLarge,
+    variant_cache, variant_etag, VARIANT_FORMATS, IMAGE_MAX_DIMENSION
+)
+from utils.image_gc import collect_image_garbage, maintain_image_gc, gc_stats
+from utils.metrics import registry as metrics_registry, MetricsRoute, pool_stats
+from utils.cart_helper import cart_item_summary, add_cart_line, set_cart_line
+from utils.response_helper import (
+    FastJSONResponse,
+    ITEM_PROJECTION,
+    item_view,
+    with_held,
+    dumps,
+    etag_matches,
+    etag_headers,
+    not_modified,
+)
+from utils.catalog_version import (
+    catalog_version,
+    maintain_catalog_version,
+    item_etag,
+    invalidate_catalog_cache,
+)
+from utils.export_helper import EXPORT_FORMATS, export_stream
+from utils.import_helper import IMPORT_FORMATS, BulkImport, detect_format, iter_rows
+from utils.notification_helper import record_stock_notifications
+from utils.notification_bus import (
+    notification_bus,
+    notification_data,
+    event_id,
+    parse_event_id,
+    publish_item_event,
+    publish_import_event,
+    format_sse,
+    STREAM_KEEPALIVE,
+)
+from utils.pagination_helper import (
+    SORTABLE_FIELDS,
+    InvalidCursor,
+    encode_cursor,
+    decode_cursor,
+    keyset_filter,
+    sort_spec,
+)
+from utils.inventory_helper import (
+    stock_delta,
+    apply_stock_delta,
+    get_inventory_stats,
+    reconcile_inventory_stats,
+)
+from utils.brand_helper import brand_filter, normalize_brand
+from db.migrations import backfill_brand_keys, backfill_item_ids, migration_status
+from db.indexes import ensure_indexes, manifest_version, report_unindexed_queries
+from utils.cache import (
+    cache_manager,
+    ITEMS_TAG,
+    ITEMS_CACHE_TTL,
+    get_items_list_key,
+    get_item_detail_key,
+    get_search_results_key,
+    get_items_count_key,
+    get_items_paged_count_key,
+)
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/token")
+# EventSource cannot send headers, so streams also accept ?token=
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/token", auto_error=False)
 
 # ---------------- MODELS ----------------
 class Token(BaseModel):
@@ -45,6 +132,7 @@ class Item(BaseModel):
     description: str
     in_stock: bool = True
     created_by: Optional[str] = None
+    image_id: Optional[str] = None
 
 
 class ItemUpdate(BaseModel):
@@ -84,9 +172,11 @@ class PaymentChargeRequest(BaseModel):
 UPLOAD_DIR = "uploads"
 if not os.path.exists(UPLOAD_DIR):
     os.makedirs(UPLOAD_DIR)
-e 
+
 # Mount static files for serving images
 app = FastAPI(title="Inventory API", version="1.0")
+# Every route below is timed under its path template for /metrics
+app.router.route_class = MetricsRoute
 app.mount("/uploads", StaticFiles(directory=UPLOAD_DIR), name="uploads")
 
 app.add_middleware(
@@ -103,27 +193,60 @@ app.add_middleware(
 
 
 # ---------------- STARTUP ----------------
+# Strong references so background tasks are not garbage-collected mid-run
+_background_tasks = set()
+
+def run_in_background(coro):
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
 @app.on_event("startup")
 async def startup():
     await check_mongo_connection()
-    # Backfill UUIDs for items missing an 'id'
+    await cache_manager.connect()
+    # Rebuild the stock counters if the document is missing or partial, before any write adjusts them
     try:
-        cursor = items_collection.find({"$or": [{"id": {"$exists": False}}, {"id": None}, {"id": ""}]})
-        async for item in cursor:
-            new_id = str(uuid.uuid4())
-            await items_collection.update_one({"_id": item["_id"]}, {"$set": {"id": new_id}})
+        await get_inventory_stats()
     except Exception as e:
-        # Log but don't block startup
-        print(f"⚠️ UUID backfill error: {e}")
-
+        print(f"Inventory stats check error: {e}")
+    # Add normalized brand keys to legacy documents without holding up startup
+    run_in_background(backfill_brand_keys())
+    # Typeahead index is built in the background and refreshed periodically
+    run_in_background(maintain_search_index())
+    # Backfill UUIDs for items missing an 'id' in the background; one worker runs it
+    run_in_background(backfill_item_ids())
+    # Shared catalog version behind the ETags; also follows writes made by other workers
+    run_in_background(maintain_catalog_version())
+    # Flushes hot-brand sales and returns idle reserved stock
+    run_in_background(maintain_reservations())
+    # Compacts minute sales buckets into hours
+    run_in_background(maintain_sales_rollups())
+    # Removes upload files no item or archived item refers to
+    run_in_background(maintain_image_gc())
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    # Write pending hot-brand sales and hand unsold reserved stock back
+    await reservation_ledger.close()
+    await cache_manager.disconnect()
+    shutdown_image_pool()
 
 
 # ---------------- HELPERS ----------------
+def naive_utc(moment: datetime) -> datetime:
+    """Query parameters may carry an offset; Mongo dates here are stored as naive UTC"""
+    if moment.tzinfo is None:
+        return moment
+    return moment.astimezone(timezone.utc).replace(tzinfo=None)
+
 async def get_current_user(token: str = Depends(oauth2_scheme)):
     payload = decode_token(token)
     if not payload:
         raise HTTPException(status_code=401, detail="Invalid or expired token")
-    user = await users_collection.find_one({"username": payload.get("sub")})
+    user = await get_principal(payload.get("sub"))
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     return user
@@ -146,11 +269,16 @@ async def create_user(user: UserCreate):
     if await users_collection.find_one({"username": user.username}):
         raise HTTPException(400, detail="Username already exists")
 
+    try:
+        hashed_password = await hash_password_async(user.password)
+    except PasswordPoolBusy:
+        raise HTTPException(503, detail="Server busy, please retry")
+
     user_id = str(uuid.uuid4())
     await users_collection.insert_one({
         "id": user_id,
         "username": user.username,
-        "hashed_password": hash_password(user.password),
+        "hashed_password": hashed_password,
         "role": user.role
     })
     return {"msg": f"{user.role.capitalize()} created successfully", "id": user_id}
@@ -159,7 +287,11 @@ async def create_user(user: UserCreate):
 @app.post("/auth/token", response_model=Token, tags=["Auth"])
 async def login(form: OAuth2PasswordRequestForm = Depends()):
     user = await users_collection.find_one({"username": form.username})
-    if not user or not verify_password(form.password, user["hashed_password"]):
+    try:
+        valid = bool(user) and await verify_password_async(form.password, user["hashed_password"])
+    except PasswordPoolBusy:
+        raise HTTPException(503, detail="Server busy, please retry")
+    if not valid:
         raise HTTPException(400, detail="Incorrect username or password")
     token = create_token({"sub": user["username"], "role": user["role"]})
     return {"access_token": token, "token_type": "bearer"}
@@ -170,6 +302,11 @@ async def me(user=Depends(get_current_user)):
     return {"username": user.get("username"), "role": user.get("role")}
 
 
+@app.get("/auth/password-pool", tags=["Auth"])
+async def password_pool(user=Depends(require_admin_or_superadmin)):
+    return password_pool_stats()
+
+
 # ---------------- ITEMS ----------------
 @app.post("/items", response_model=Item, tags=["Items"])
 async def create_item(item: Item, user=Depends(get_current_user)):
@@ -177,7 +314,7 @@ async def create_item(item: Item, user=Depends(get_current_user)):
         raise HTTPException(403, detail="Users cannot create items")
 
     # Enforce unique brand (case-insensitive)
-    if await items_collection.find_one({"brand": {"$regex": f"^{item.brand}$", "$options": "i"}}):
+    if await items_collection.find_one(brand_filter(item.brand)):
         raise HTTPException(400, detail="Brand already exists")
 
     count = await items_collection.count_documents({"created_by": user["username"]})
@@ -191,72 +328,167 @@ async def create_item(item: Item, user=Depends(get_current_user)):
 
     item_data = item.dict()
     item_data["id"] = item_id
+    item_data["brand_key"] = normalize_brand(item.brand)
     item_data["created_by"] = user["username"]
     item_data["in_stock"] = in_stock
+    item_data["updated_at"] = datetime.utcnow()
 
     await items_collection.insert_one(item_data)
+    await apply_stock_delta(stock_delta(None, in_stock))
+    item_search_index.upsert(item_data)
+    publish_item_event(user["username"], "created", item_data)
+    await invalidate_catalog_cache(summaries=True)
 
     return {**item.dict(), "id": item_id, "in_stock": in_stock, "created_by": user["username"]}
 
 
+@app.post("/items/bulk", tags=["Items"])
+async def bulk_import_items(
+    request: Request,
+    mode: str = "insert",
+    format: Optional[str] = None,
+    user=Depends(get_current_user),
+):
+    """
+    Import a JSON array, NDJSON or CSV of items, as the request body or a
+    multipart `file` upload. mode=upsert updates brands that already exist.
+    """
+    if user["role"] == "user":
+        raise HTTPException(403, detail="Users cannot create items")
+    if mode not in ("insert", "upsert"):
+        raise HTTPException(400, detail="mode must be insert or upsert")
+    if format is not None and format not in IMPORT_FORMATS:
+        raise HTTPException(400, detail=f"format must be one of: {', '.join(IMPORT_FORMATS)}")
+
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form()
+        upload = form.get("file")
+        if upload is None or isinstance(upload, str):
+            raise HTTPException(400, detail="Missing file upload")
+        fmt = format or detect_format(upload.content_type, upload.filename)
+
+        async def chunks():
+            while chunk := await upload.read(64 * 1024):
+                yield chunk
+        source = chunks()
+    else:
+        fmt = format or detect_format(content_type)
+        source = request.stream()
+
+    job = BulkImport(user, Item, mode)
+    summary = await job.run(iter_rows(fmt, source))
+
+    await apply_stock_delta(job.counters)
+    if summary["inserted"] or summary["updated"]:
+        publish_import_event(user["username"], summary)
+        await invalidate_catalog_cache(summaries=True)
+    return summary
+
+
 # ---------------- BUY ----------------
 @app.post("/items/buy/{brand}", tags=["Buy"])
 async def buy_item(brand: str):
+    if reservation_ledger.is_hot(brand):
+        # Flash-sale brands sell from stock this worker already claimed; falls
+        # through to the normal path for out-of-stock / not-found answers
+        item = await reservation_ledger.buy(brand)
+        if item:
+            return {"msg": f"Purchased {item['name']} successfully"}
+
     # Atomic decrement if quantity > 0
     updated = await items_collection.find_one_and_update(
-        {"brand": {"$regex": f"^{brand}$", "$options": "i"}, "quantity": {"$gt": 0}},
-        {"$inc": {"quantity": -1}},
+        {**brand_filter(brand), "quantity": {"$gt": 0}},
+        {"$inc": {"quantity": -1}, "$set": {"updated_at": datetime.utcnow()}},
         return_document=ReturnDocument.AFTER,
         projection={"_id": 0}
     )
 
     if not updated:
-        existing = await items_collection.find_one({"brand": {"$regex": f"^{brand}$", "$options": "i"}})
+        existing = await items_collection.find_one(brand_filter(brand))
         if not existing:
             raise HTTPException(404, detail="Item not found")
         raise HTTPException(400, detail="Out of stock")
 
+    # Units hot-brand ledgers hold are still for sale, as checkout counts them
+    updated = with_held(updated)
     in_stock_now = updated.get("quantity", 0) > 0
     if in_stock_now != updated.get("in_stock"):
-        await items_collection.update_one(
-            {"brand": {"$regex": f"^{brand}$", "$options": "i"}},
+        # Conditional so only one concurrent buyer moves the inventory counters
+        flipped = await items_collection.update_one(
+            {**brand_filter(brand), "in_stock": {"$ne": in_stock_now}},
             {"$set": {"in_stock": in_stock_now}}
         )
+        if flipped.modified_count:
+            await apply_stock_delta(stock_delta(not in_stock_now, in_stock_now))
 
     await purchases_collection.update_one(
-        {"brand": updated["brand"]},
-        {"$inc": {"quantity_sold": 1}, "$set": {"name": updated["name"]}},
+        brand_filter(updated["brand"]),
+        {"$inc": {"quantity_sold": 1}, "$set": {
+            "brand": updated["brand"], "brand_key": normalize_brand(updated["brand"]), "name": updated["name"]
+        }},
         upsert=True
     )
 
-    if updated["quantity"] < 3:
-        notification_msg = f"{updated['name']} stock is low: {updated['quantity']} left"
-    else:
-        notification_msg = f"{updated['name']} updated stock"
-
-    await notifications_collection.insert_one({
-        "brand": updated["brand"],
-        "name": updated["name"],
-        "quantity": updated["quantity"],
-        "in_stock": in_stock_now,
-        "created_by": updated.get("created_by", "system"),
-        "msg": notification_msg,
-        "notified_at": datetime.utcnow()
-    })
+    await record_stock_notifications([({**updated, "in_stock": in_stock_now}, 1)])
+    await record_sales([(updated["brand"], 1, updated.get("price"))])
+    await invalidate_catalog_cache()
     return {"msg": f"Purchased {updated['name']} successfully"}
 
 
+# ---------------- RESERVATIONS (HOT BRANDS) ----------------
+@app.put("/reservations/hot/{brand}", tags=["Buy"])
+async def set_hot_brand(brand: str, enabled: bool = True, user=Depends(require_admin_or_superadmin)):
+    """Serve a brand's purchases from the in-process reservation ledger"""
+    if not await reservation_ledger.set_hot(brand, enabled):
+        raise HTTPException(404, detail="Item not found")
+    return {"msg": f"{brand} {'flagged' if enabled else 'no longer'} hot"}
+
+@app.get("/reservations/stats", tags=["Buy"])
+async def reservation_stats(user=Depends(require_admin_or_superadmin)):
+    return reservation_ledger.snapshot()
+
+@app.post("/reservations/release-expired", tags=["Buy"])
+async def release_expired(user=Depends(require_admin_or_superadmin)):
+    """Return stock still held by workers that died without releasing it"""
+    return {"released": await release_expired_reservations()}
+
+
+# ---------------- ANALYTICS ----------------
+@app.get("/analytics/sales", tags=["Analytics"])
+async def sales_analytics(
+    brand: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    granularity: str = "hour",
+    user=Depends(require_admin_or_superadmin),
+):
+    """Units and revenue per minute/hour/day from pre-aggregated buckets; defaults to the last 24h"""
+    if granularity not in SALES_GRANULARITIES:
+        raise HTTPException(400, detail=f"granularity must be one of {', '.join(SALES_GRANULARITIES)}")
+    end = naive_utc(end) if end else datetime.utcnow()
+    start = naive_utc(start) if start else end - timedelta(days=1)
+    if start >= end:
+        raise HTTPException(400, detail="start must be before end")
+    return FastJSONResponse(await query_sales(start, end, granularity, brand))
+
+@app.post("/analytics/sales/rollup", tags=["Analytics"])
+async def run_sales_rollup(user=Depends(require_admin_or_superadmin)):
+    return await rollup_sales()
+
+
 # ---------------- SOLD ----------------
 @app.get("/items/sold/{brand}", tags=["Sold"])
 async def sold_items(brand: str):
-    sold = await purchases_collection.find_one(
-        {"brand": {"$regex": f"^{brand}$", "$options": "i"}}, {"_id": 0}
+    # Reporting read; may lag the primary by up to CATALOG_MAX_STALENESS_SECONDS
+    sold = await catalog_purchases_collection.find_one(
+        brand_filter(brand), {"_id": 0}
     )
     if not sold:
         raise HTTPException(404, detail="Item not found in sold records")
 
-    item = await items_collection.find_one(
-        {"brand": {"$regex": f"^{brand}$", "$options": "i"}},
+    item = await catalog_items_collection.find_one(
+        brand_filter(brand),
         {"_id": 0, "quantity": 1}
     )
     remaining_quantity = item["quantity"] if item else 0
@@ -271,98 +503,241 @@ async def sold_items(brand: str):
 
 # ---------------- LIST ----------------
 @app.get("/items", response_model=List[Item], tags=["List"])
-async def list_items():
-    return await items_collection.find({}, {"_id": 0}).to_list(length=100)
+async def list_items(request: Request):
+    # Unchanged catalog: answer from the in-process version, no DB or cache lookup
+    etag = catalog_version.etag()
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return not_modified(etag)
+    # Cached as encoded JSON; the projection is trusted, so no pydantic round trip
+    cached = await cache_manager.get_or_load(
+        get_items_list_key(), _load_items_body, ttl=ITEMS_CACHE_TTL, tags=[ITEMS_TAG]
+    )
+    return FastJSONResponse(cached["body"], headers=etag_headers(cached["etag"]))
+
+async def _load_items_body():
+    async def read(session):
+        return await catalog_items_collection.find({}, ITEM_PROJECTION, session=session).to_list(length=100)
+    etag, items = await catalog_version.catalog_read(read)
+    return {"etag": etag, "body": dumps([item_view(doc) for doc in items])}
 
 @app.get("/items/count", tags=["List"])
-async def get_items_count():
-    total_items = await items_collection.count_documents({})
-    in_stock_count = await items_collection.count_documents({"in_stock": True})
-    out_of_stock_count = await items_collection.count_documents({"in_stock": False})
+async def get_items_count(request: Request):
+    etag = catalog_version.etag()
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return not_modified(etag)
+    cached = await cache_manager.get_or_load(
+        get_items_count_key(), _load_items_count, ttl=ITEMS_CACHE_TTL, tags=[ITEMS_TAG]
+    )
+    return FastJSONResponse(cached["body"], headers=etag_headers(cached["etag"]))
 
-    items = await items_collection.find({}, {"_id": 0, "name": 1, "quantity": 1}).to_list(length=100)
+async def _load_items_count():
+    etag = catalog_version.etag()
+    # Counters are maintained incrementally by the write paths
+    stats = await get_inventory_stats()
+
+    items = await items_collection.find({}, {"_id": 0, "name": 1, "quantity": 1, "reserved": 1}).to_list(length=100)
+
+    return {"etag": etag, "body": dumps({
+        "total_items": stats["total_items"],
+        "in_stock": stats["in_stock"],
+        "out_of_stock": stats["out_of_stock"],
+        "items": [with_held(doc) for doc in items]
+    })}
+
+@app.post("/items/count/reconcile", tags=["List"])
+async def reconcile_items_count(user=Depends(require_admin_or_superadmin)):
+    counts = await reconcile_inventory_stats()
+    await invalidate_catalog_cache()
+    return {"msg": "Inventory counters rebuilt", **counts}
+
+# ---------------- LIST (PAGINATED/SORTED/FILTERED) ----------------
+@app.get("/items/paged", tags=["List"])
+async def list_items_paged(
+    cursor: Optional[str] = None,
+    # 0 would mean "no limit" to Mongo and leave no last row to build a cursor from
+    limit: int = Query(20, ge=1),
+    sort: str = "brand",
+    order: int = 1,
+    brand: Optional[str] = None,
+    name: Optional[str] = None,
+    in_stock: Optional[bool] = None,
+    q: Optional[str] = None,
+    include_total: bool = False,
+):
+    if sort not in SORTABLE_FIELDS:
+        raise HTTPException(400, detail=f"sort must be one of: {', '.join(SORTABLE_FIELDS)}")
+    if order not in (1, -1):
+        raise HTTPException(400, detail="order must be 1 or -1")
+    if limit > 100:
+        limit = 100
+    query: dict = {}
+    if brand:
+        query["brand"] = {"$regex": re.escape(brand), "$options": "i"}
+    if name:
+        query["name"] = {"$regex": re.escape(name), "$options": "i"}
+    if in_stock is not None:
+        query["in_stock"] = in_stock
+    brands = item_search_index.matching_brands(q) if q and item_search_index.ready else None
+    if brands is not None:
+        query["$and"] = [{"brand": {"$in": brands}}]
+    elif q:
+        query["$or"] = [
+            {"brand": {"$regex": re.escape(q), "$options": "i"}},
+            {"name": {"$regex": re.escape(q), "$options": "i"}},
+            {"description": {"$regex": re.escape(q), "$options": "i"}},
+        ]
+
+    page_query = query
+    if cursor:
+        try:
+            position = decode_cursor(cursor, sort, order)
+        except InvalidCursor as e:
+            raise HTTPException(400, detail=str(e))
+        page_query = {"$and": [query, keyset_filter(sort, order, position)]} if query else keyset_filter(sort, order, position)
+
+    rows = catalog_items_collection.find(page_query, {"_id": 0}).sort(sort_spec(sort, order)).limit(limit)
+    data = await rows.to_list(length=limit)
+    next_cursor = encode_cursor(sort, order, data[-1]) if len(data) == limit else None
+
+    response = {"data": [with_held(doc) for doc in data], "next_cursor": next_cursor, "limit": limit}
+    if include_total:
+        filters = {"brand": brand, "name": name, "in_stock": in_stock, "q": q}
+        response["total"] = await _estimated_total(query, filters)
+    return response
+
+async def _estimated_total(query: dict, filters: dict) -> int:
+    """Approximate match count, cached per request filters until the next item write"""
+    async def load():
+        if not query:
+            return await catalog_items_collection.estimated_document_count()
+        return await catalog_items_collection.count_documents(query)
+    return await cache_manager.get_or_load(
+        get_items_paged_count_key(filters), load, ttl=ITEMS_CACHE_TTL, tags=[ITEMS_TAG]
+    )
+
+
+# ---------------- EXPORT ----------------
+@app.get("/items/export", tags=["List"])
+async def export_items(
+    format: str = "ndjson",
+    brand: Optional[str] = None,
+    name: Optional[str] = None,
+    in_stock: Optional[bool] = None,
+    created_by: Optional[str] = None,
+):
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(400, detail=f"format must be one of: {', '.join(EXPORT_FORMATS)}")
+    query: dict = {}
+    if brand:
+        query["brand"] = {"$regex": re.escape(brand), "$options": "i"}
+    if name:
+        query["name"] = {"$regex": re.escape(name), "$options": "i"}
+    if in_stock is not None:
+        query["in_stock"] = in_stock
+    if created_by:
+        query["created_by"] = created_by
+    return StreamingResponse(
+        export_stream(format, query),
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="items.{format}"'},
+    )
+
+
+# ---------------- SEARCH ----------------
+@app.get("/items/search", tags=["Search"])
+async def search_items(q: str):
+    return await cache_manager.get_or_load(
+        get_search_results_key(q), lambda: mongo_text_search(q), ttl=ITEMS_CACHE_TTL, tags=[ITEMS_TAG]
+    )
+
+
+@app.get("/items/suggest", tags=["Search"])
+async def suggest(q: str, limit: int = 10):
+    return {"suggestions": await suggest_items(q, min(limit, 50))}
 
-    return {
-        "total_items": total_items,
-        "in_stock": in_stock_count,
-        "out_of_stock": out_of_stock_count,
-        "items": items
-    }
 
 @app.get("/items/{brand}", response_model=Item, tags=["List"])
-async def get_item(brand: str):
-    item = await items_collection.find_one({"brand": {"$regex": f"^{brand}$", "$options": "i"}}, {"_id": 0})
-    if not item:
+async def get_item(brand: str, request: Request):
+    cached = await cache_manager.get_or_load(
+        get_item_detail_key(normalize_brand(brand)),
+        lambda: _load_item_body(brand),
+        ttl=ITEMS_CACHE_TTL,
+        tags=[ITEMS_TAG],
+    )
+    if not cached:
         raise HTTPException(404, detail="Item not found")
-    return item
+    # Per-item ETag from updated_at, so writes to other items don't invalidate it
+    if etag_matches(request.headers.get("if-none-match"), cached["etag"]):
+        return not_modified(cached["etag"])
+    return FastJSONResponse(cached["body"], headers=etag_headers(cached["etag"]))
+
+async def _load_item_body(brand: str):
+    item = await items_collection.find_one(brand_filter(brand), {**ITEM_PROJECTION, "updated_at": 1})
+    if not item:
+        return None
+    return {"etag": item_etag(item), "body": dumps(item_view(item))}
 
 
 # ---------------- UPDATE/DELETE ----------------
 @app.put("/items/{brand}", tags=["Update/Delete"])
 async def update_item(brand: str, item: Item, user=Depends(require_admin_or_superadmin)):
-    existing_item = await items_collection.find_one({"brand": {"$regex": f"^{brand}$", "$options": "i"}}, {"_id": 0})
+    existing_item = await items_collection.find_one(brand_filter(brand), {"_id": 0})
     if not existing_item:
         raise HTTPException(404, detail="Item not found")
 
     item_dict = item.dict(exclude_unset=True)
     if "quantity" in item_dict:
         item_dict["in_stock"] = item_dict["quantity"] > 0
+    if "brand" in item_dict:
+        item_dict["brand_key"] = normalize_brand(item_dict["brand"])
 
     item_dict["created_by"] = existing_item.get("created_by", user["username"])
     item_dict["updated_by"] = user["username"]
     item_dict["updated_at"] = datetime.utcnow()
 
-    updated_item = await items_collection.find_one_and_update(
-        {"brand": {"$regex": f"^{brand}$", "$options": "i"}},
-        {"$set": item_dict},
-        return_document=ReturnDocument.AFTER,
-        projection={"_id": 0}
-    )
+    update = {"$set": item_dict}
+    if "quantity" in item_dict:
+        # The new quantity is absolute: settle ledger sales first, then drop its reservations
+        await reservation_ledger.reset(brand)
+        update["$unset"] = RESET_RESERVATIONS
+    before_item, updated_item = await _update_item_document(brand, update)
+    if updated_item:
+        item_search_index.remove(before_item["brand"])
+        item_search_index.upsert(updated_item)
+        publish_item_event(updated_item.get("created_by"), "updated", updated_item)
+    await invalidate_catalog_cache(summaries=True)
 
     return {
         "msg": "Item updated successfully",
-        "before_update": existing_item,
+        "before_update": before_item or existing_item,
         "after_update": updated_item
     }
 
 
-# ---------------- LIST (PAGINATED/SORTED/FILTERED) ----------------
-@app.get("/items/paged", tags=["List"])
-async def list_items_paged(
-    skip: int = 0,
-    limit: int = 20,
-    sort: str = "brand",
-    order: int = 1,
-    brand: Optional[str] = None,
-    name: Optional[str] = None,
-    in_stock: Optional[bool] = None,
-    q: Optional[str] = None,
-):
-    if limit > 100:
-        limit = 100
-    query: dict = {}
-    if brand:
-        query["brand"] = {"$regex": brand, "$options": "i"}
-    if name:
-        query["name"] = {"$regex": name, "$options": "i"}
-    if in_stock is not None:
-        query["in_stock"] = in_stock
-    if q:
-        query["$or"] = [
-            {"brand": {"$regex": q, "$options": "i"}},
-            {"name": {"$regex": q, "$options": "i"}},
-            {"description": {"$regex": q, "$options": "i"}},
-        ]
-
-    total = await items_collection.count_documents(query)
-    cursor = items_collection.find(query, {"_id": 0}).sort(sort, order).skip(skip).limit(limit)
-    data = await cursor.to_list(length=limit)
-    return {"data": data, "total": total, "skip": skip, "limit": limit}
+async def _update_item_document(brand: str, update: dict):
+    """
+    Apply a $set/$unset update; returns (before, after), or (None, None) if the
+    item is gone. The pre-image comes from the write itself, so the stock
+    counters see exactly the in_stock flip this write made, even when a buy
+    lands between the handler's first read and the write.
+    """
+    before = await items_collection.find_one_and_update(
+        brand_filter(brand),
+        update,
+        return_document=ReturnDocument.BEFORE,
+        projection={"_id": 0}
+    )
+    if before is None:
+        return None, None
+    after = {k: v for k, v in before.items() if k not in update.get("$unset", {})}
+    after.update(update["$set"])
+    await apply_stock_delta(stock_delta(before.get("in_stock"), after.get("in_stock")))
+    return before, after
 
 
 @app.patch("/items/{brand}", tags=["Update/Delete"])
 async def patch_item(brand: str, item: ItemUpdate, user=Depends(require_admin_or_superadmin)):
-    existing_item = await items_collection.find_one({"brand": {"$regex": f"^{brand}$", "$options": "i"}}, {"_id": 0})
+    existing_item = await items_collection.find_one(brand_filter(brand), {"_id": 0})
     if not existing_item:
         raise HTTPException(404, detail="Item not found")
 
@@ -372,19 +747,25 @@ async def patch_item(brand: str, item: ItemUpdate, user=Depends(require_admin_or
 
     if "quantity" in update_dict:
         update_dict["in_stock"] = update_dict["quantity"] > 0
+    if "brand" in update_dict:
+        update_dict["brand_key"] = normalize_brand(update_dict["brand"])
 
-    updated_item = await items_collection.find_one_and_update(
-        {"brand": {"$regex": f"^{brand}$", "$options": "i"}},
-        {"$set": {**update_dict, "updated_by": user["username"], "updated_at": datetime.utcnow()}},
-        return_document=ReturnDocument.AFTER,
-        projection={"_id": 0}
-    )
+    update = {"$set": {**update_dict, "updated_by": user["username"], "updated_at": datetime.utcnow()}}
+    if "quantity" in update_dict:
+        await reservation_ledger.reset(brand)
+        update["$unset"] = RESET_RESERVATIONS
+    before_item, updated_item = await _update_item_document(brand, update)
+    if updated_item:
+        item_search_index.remove(before_item["brand"])
+        item_search_index.upsert(updated_item)
+        publish_item_event(updated_item.get("created_by"), "updated", updated_item)
+    await invalidate_catalog_cache(summaries=True)
 
     return {"msg": "Item updated successfully", "after_update": updated_item}
 
 @app.delete("/items/{brand}", tags=["Update/Delete"])
 async def delete_item(brand: str, user=Depends(require_admin_or_superadmin)):
-    existing_item = await items_collection.find_one({"brand": {"$regex": f"^{brand}$", "$options": "i"}})
+    existing_item = await items_collection.find_one(brand_filter(brand))
     if not existing_item:
         raise HTTPException(404, detail="Item not found")
 
@@ -394,7 +775,12 @@ async def delete_item(brand: str, user=Depends(require_admin_or_superadmin)):
     archive_item["deleted_at"] = datetime.utcnow()
 
     await deleted_items_collection.insert_one(archive_item)
-    await items_collection.delete_one({"brand": {"$regex": f"^{brand}$", "$options": "i"}})
+    deleted = await items_collection.delete_one(brand_filter(brand))
+    if deleted.deleted_count:
+        await apply_stock_delta(stock_delta(existing_item.get("in_stock"), None))
+        item_search_index.remove(existing_item["brand"])
+        publish_item_event(created_by, "deleted", existing_item)
+    await invalidate_catalog_cache(summaries=True)
 
     return {
         "msg": "Item deleted successfully",
@@ -407,23 +793,221 @@ async def delete_item(brand: str, user=Depends(require_admin_or_superadmin)):
     }
 
 
-# ---------------- SEARCH ----------------
-@app.get("/items/search", tags=["Search"])
-async def search_items(q: str):
-    return await mongo_text_search(q)
+# ---------------- IMAGES ----------------
+@app.post("/items/{brand}/image", tags=["Images"])
+async def upload_item_image(brand: str, file: UploadFile = File(...), user=Depends(require_admin_or_superadmin)):
+    """Attach an image; stored by content hash with thumb/medium/WebP renditions"""
+    existing = await items_collection.find_one(brand_filter(brand), {"_id": 0, "brand": 1})
+    if not existing:
+        raise HTTPException(404, detail="Item not found")
+    try:
+        image = await ingest_image(file)
+    except ImageTooLarge as e:
+        raise HTTPException(413, detail=str(e))
+    except InvalidImage as e:
+        raise HTTPException(400, detail=str(e))
+    except ImagePoolBusy:
+        raise HTTPException(503, detail="Server busy, please retry")
+    finally:
+        await file.close()
+
+    updated_item = await items_collection.find_one_and_update(
+        brand_filter(brand),
+        {"$set": {"image_id": image["image_id"], "updated_by": user["username"], "updated_at": datetime.utcnow()}},
+        return_document=ReturnDocument.AFTER,
+        projection={"_id": 0}
+    )
+    if updated_item:
+        publish_item_event(updated_item.get("created_by"), "updated", updated_item)
+    await invalidate_catalog_cache()
+    return {"msg": "Image uploaded", **image}
+
+
+@app.get("/images/{image_id}", tags=["Images"])
+async def get_image(request: Request, image_id: str, w: Optional[int] = None, h: Optional[int] = None,
+                    fmt: str = "jpeg"):
+    """Image resized to fit w x h, rendered on first request and then served from the disk cache"""
+    for value in (w, h):
+        if value is not None and not 1 <= value <= IMAGE_MAX_DIMENSION:
+            raise HTTPException(400, detail=f"w and h must be between 1 and {IMAGE_MAX_DIMENSION}")
+    if fmt not in VARIANT_FORMATS:
+        raise HTTPException(400, detail=f"fmt must be one of: {', '.join(VARIANT_FORMATS)}")
+    width, height = w or 0, h or 0
+
+    etag = variant_etag(image_id, width, height, fmt)
+    # The bytes behind an image id never change, so caches may keep them forever
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=31536000, immutable"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    try:
+        path = await variant_cache.get(image_id, width, height, fmt)
+    except FileNotFoundError:
+        raise HTTPException(404, detail="Image not found")
+    except ImagePoolBusy:
+        raise HTTPException(503, detail="Server busy, please retry")
+    # FileResponse answers Range / If-Range requests itself
+    return FileResponse(path, media_type=VARIANT_FORMATS[fmt][2], headers=headers)
+
+
+@app.get("/images/cache/stats", tags=["Images"])
+async def image_cache_stats(user=Depends(require_admin_or_superadmin)):
+    return {"variants": variant_cache.stats(), "gc": gc_stats}
+
+
+@app.post("/images/gc", tags=["Images"])
+async def run_image_gc(user=Depends(require_admin_or_superadmin)):
+    """Collect unreferenced upload files now instead of waiting for the schedule"""
+    return await collect_image_garbage()
+
+
+# ---------------- MIGRATIONS ----------------
+@app.get("/migrations/status", tags=["Migrations"])
+async def get_migration_status(user=Depends(require_admin_or_superadmin)):
+    migrations = await migration_status()
+    return {"migrations": [{"name": m.pop("_id"), **m} for m in migrations]}
+
+
+# ---------------- INDEXES ----------------
+@app.get("/indexes/report", tags=["Migrations"])
+async def index_report(user=Depends(require_admin_or_superadmin)):
+    return {"version": manifest_version(), "unindexed_queries": await report_unindexed_queries()}
+
+
+@app.post("/indexes/sync", tags=["Migrations"])
+async def index_sync(user=Depends(require_admin_or_superadmin)):
+    return await ensure_indexes(force=True)
+
+
+# ---------------- DATABASE ----------------
+@app.get("/db/pool", tags=["Database"])
+async def db_pool_stats(user=Depends(require_admin_or_superadmin)):
+    """Connection pool occupancy and checkout wait for this worker, per server"""
+    return {
+        "config": {
+            "max_pool_size": MONGO_MAX_POOL_SIZE,
+            "min_pool_size": MONGO_MIN_POOL_SIZE,
+            "max_connecting": MONGO_MAX_CONNECTING,
+            "wait_queue_timeout_ms": MONGO_WAIT_QUEUE_TIMEOUT_MS,
+            "catalog_read_preference": "secondaryPreferred" if CATALOG_READS_FROM_SECONDARIES else "primary",
+            "catalog_max_staleness_seconds": CATALOG_MAX_STALENESS_SECONDS,
+        },
+        "pools": pool_stats(),
+    }
+
+
+# ---------------- CACHE ----------------
+@app.get("/cache/stats", tags=["Cache"])
+async def cache_stats(user=Depends(require_admin_or_superadmin)):
+    return {"catalog": cache_manager.stats(), "auth": auth_cache_stats()}
+
+
+# ---------------- METRICS ----------------
+def _cache_metrics():
+    caches = {
+        "catalog": cache_manager.stats(),
+        "principal": auth_cache_stats()["principals"],
+        "token": auth_cache_stats()["tokens"],
+        "image_variant": variant_cache.stats(),
+    }
+    for kind in ("hits", "misses"):
+        yield (f"cache_{kind}", "counter", f"Cache {kind} by cache",
+               [({"cache": name}, stats[kind]) for name, stats in caches.items()])
+    yield ("cache_evictions", "counter", "Entries evicted to stay within the size bound",
+           [({"cache": name}, stats["evictions"]) for name, stats in caches.items() if "evictions" in stats])
+
+
+metrics_registry.register_collector(_cache_metrics)
+
+
+@app.get("/metrics", tags=["Metrics"])
+async def metrics():
+    """Prometheus text exposition"""
+    return Response(metrics_registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
 
 
 # ---------------- NOTIFICATIONS ----------------
 @app.get("/notifications", tags=["Notifications"])
-async def get_notifications(user=Depends(get_current_user)):
+async def get_notifications(since: Optional[datetime] = None, user=Depends(get_current_user)):
+    """Newest first; pass the returned `latest` back as `since` to fetch only changes"""
     if user["role"] not in ["admin", "superadmin"]:
         raise HTTPException(403, detail="Admins or Superadmins only")
 
+    query = {"created_by": user["username"]}
+    if since is not None:
+        since = naive_utc(since)
+        query["notified_at"] = {"$gt": since}
+
     limit = 50 if user["role"] == "admin" else 100
-    notifications = await notifications_collection.find(
-        {"created_by": user["username"]}, {"_id": 0}
-    ).to_list(length=limit)
-    return {"notifications": notifications}
+    docs = await notifications_collection.find(query).sort("notified_at", -1).to_list(length=limit)
+    return {
+        "notifications": [notification_data(doc) for doc in docs],
+        "latest": docs[0]["notified_at"] if docs else since,
+    }
+
+@app.get("/notifications/stream", tags=["Notifications"])
+async def stream_notifications(
+    request: Request,
+    token: Optional[str] = None,
+    last_id: Optional[str] = None,
+    header_token: Optional[str] = Depends(optional_oauth2_scheme),
+):
+    """
+    Server-Sent Events: new notifications and item changes for the caller.
+    Resumes after `last_id` (or the Last-Event-ID header) by replaying from Mongo.
+    """
+    user = await get_current_user(token or header_token or "")
+    if user["role"] not in ["admin", "superadmin"]:
+        raise HTTPException(403, detail="Admins or Superadmins only")
+
+    resume_from = request.headers.get("last-event-id") or last_id
+    if resume_from:
+        try:
+            resume_from = parse_event_id(resume_from)
+        except ValueError:
+            raise HTTPException(400, detail="Invalid last event id")
+
+    # Subscribe before replaying so nothing published in between is missed
+    subscription = notification_bus.subscribe(user["username"])
+    return StreamingResponse(
+        _notification_events(request, subscription, resume_from),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+async def _notification_events(request: Request, subscription, resume_from):
+    try:
+        yield "retry: 3000\n\n"
+        replayed = set()
+        # Coalesced notifications are updated in place, so resume by notified_at;
+        # page by (notified_at, _id) until the replay has caught up
+        while resume_from:
+            since, last_seen = resume_from
+            cursor = notifications_collection.find({"created_by": subscription.owner, "$or": [
+                {"notified_at": {"$gt": since}},
+                {"notified_at": since, "_id": {"$gt": last_seen}},
+            ]}).sort([("notified_at", 1), ("_id", 1)]).limit(100)
+            page = await cursor.to_list(length=100)
+            for doc in page:
+                replayed.add(event_id(doc))
+                yield format_sse("notification", notification_data(doc), event_id(doc))
+            resume_from = (page[-1]["notified_at"], page[-1]["_id"]) if len(page) == 100 else None
+
+        while True:
+            try:
+                event = await asyncio.wait_for(subscription.queue.get(), timeout=STREAM_KEEPALIVE)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    break
+                yield ": keep-alive\n\n"
+                continue
+            if event is None:
+                # Buffer overflowed; the client reconnects and resumes from its last id
+                break
+            if event["id"] in replayed:
+                continue
+            yield format_sse(event["event"], event["data"], event["id"])
+    finally:
+        notification_bus.unsubscribe(subscription)
 
 @app.delete("/notifications/clear", tags=["Notifications"])
 async def clear_all_notifications(user=Depends(get_current_user)):
@@ -461,62 +1045,20 @@ async def get_cart(user=Depends(get_current_user)):
 
 @app.post("/cart/add", tags=["Cart"])
 async def add_to_cart(brand: str, quantity: int = 1, user=Depends(get_current_user)):
-    item = await items_collection.find_one({"brand": {"$regex": f"^{brand}$", "$options": "i"}}, {"_id": 0})
-    if not item:
-        raise HTTPException(404, detail="Item not found")
     if quantity <= 0:
         raise HTTPException(400, detail="Quantity must be positive")
+    summary = await cart_item_summary(brand)
+    if not summary:
+        raise HTTPException(404, detail="Item not found")
     # Do not reserve stock here; reserve on checkout
-    cart = await carts_collection.find_one({"username": user["username"]})
-    if not cart:
-        cart_doc = {
-            "username": user["username"],
-            "items": [{
-                "item_id": item.get("id"),
-                "brand": item["brand"],
-                "name": item["name"],
-                "price": item["price"],
-                "quantity": quantity
-            }]
-        }
-        await carts_collection.insert_one(cart_doc)
-        return {"msg": "Added to cart", "cart": {"username": user["username"], "items": cart_doc["items"]}}
-
-    # If item exists in cart, increment; else push new
-    updated = await carts_collection.update_one(
-        {"username": user["username"], "items.brand": {"$regex": f"^{brand}$", "$options": "i"}},
-        {"$inc": {"items.$.quantity": quantity}}
-    )
-    if updated.modified_count == 0:
-        await carts_collection.update_one(
-            {"username": user["username"]},
-            {"$push": {"items": {
-                "item_id": item.get("id"),
-                "brand": item["brand"],
-                "name": item["name"],
-                "price": item["price"],
-                "quantity": quantity
-            }}}
-        )
-    cart_after = await carts_collection.find_one({"username": user["username"]}, {"_id": 0})
-    return {"msg": "Added to cart", "cart": cart_after}
+    cart = await add_cart_line(user["username"], summary, quantity)
+    return {"msg": "Added to cart", "cart": cart}
 
 
 @app.post("/cart/update", tags=["Cart"])
 async def update_cart_item(brand: str, quantity: int, user=Depends(get_current_user)):
-    if quantity <= 0:
-        # remove the item
-        await carts_collection.update_one(
-            {"username": user["username"]},
-            {"$pull": {"items": {"brand": {"$regex": f"^{brand}$", "$options": "i"}}}}
-        )
-    else:
-        await carts_collection.update_one(
-            {"username": user["username"], "items.brand": {"$regex": f"^{brand}$", "$options": "i"}},
-            {"$set": {"items.$.quantity": quantity}}
-        )
-    cart_after = await carts_collection.find_one({"username": user["username"]}, {"_id": 0})
-    return {"msg": "Cart updated", "cart": cart_after or {"username": user["username"], "items": []}}
+    cart = await set_cart_line(user["username"], brand, quantity)
+    return {"msg": "Cart updated", "cart": cart}
 
 
 @app.post("/cart/clear", tags=["Cart"])
@@ -535,17 +1077,9 @@ async def checkout_cart(user=Depends(get_current_user)):
     if not cart or not cart.get("items"):
         raise HTTPException(400, detail="Cart is empty")
 
-    # Try to purchase each item atomically; collect results
-    results = []
-    for entry in cart["items"]:
-        brand = entry["brand"]
-        qty = int(entry.get("quantity", 1))
-        for _ in range(qty):
-            try:
-                await buy_item(brand)  # reuse existing logic
-                results.append({"brand": brand, "status": "ok"})
-            except HTTPException as e:
-                results.append({"brand": brand, "status": "error", "detail": e.detail})
+    # Decrement every line in one bulk write; results stay one entry per unit
+    results = await bulk_checkout(cart["items"])
+    await invalidate_catalog_cache()
 
     # Clear cart regardless; alternatively, only clear successful items
     await carts_collection.update_one({"username": user["username"]}, {"$set": {"items": []}}, upsert=True)
@@ -590,4 +1124,5 @@ async def payment_charge(payload: PaymentChargeRequest, user=Depends(get_current
         "created_at": datetime.utcnow()
     }
     await payments_collection.insert_one(doc)
+    await record_sales([(ci.brand, ci.quantity, ci.price) for ci in payload.items], source="charge")
     return {"msg": "Payment recorded", "payment_id": payment_id, "amounts": quote}
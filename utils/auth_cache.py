@@ -0,0 +1,39 @@
+import os
+from db.db import users_collection
+from utils.cache import CacheManager, get_user_data_key
+from utils.token_helper import token_cache_stats
+
+# Short TTL bounds how long another worker can serve a stale role or deleted user
+PRINCIPAL_CACHE_TTL = int(os.getenv("PRINCIPAL_CACHE_TTL", 30))
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", 1000))
+
+# Separate from the catalog cache so its size and hit rate are tracked on their own
+principal_cache = CacheManager(max_entries=PRINCIPAL_CACHE_SIZE)
+
+
+async def get_principal(username: str):
+    """User document for a token subject, served from cache when fresh"""
+    if not username:
+        return None
+    return await principal_cache.get_or_load(
+        get_user_data_key(username),
+        lambda: users_collection.find_one({"username": username}),
+        ttl=PRINCIPAL_CACHE_TTL,
+    )
+
+
+async def invalidate_principal(username: str):
+    """Call whenever a user's role changes or the user is deleted"""
+    await principal_cache.delete(get_user_data_key(username))
+
+
+def auth_cache_stats() -> dict:
+    """Hit-rate counters for verified tokens and cached principals"""
+    lookups = token_cache_stats["hits"] + token_cache_stats["misses"]
+    return {
+        "tokens": {
+            **token_cache_stats,
+            "hit_rate": round(token_cache_stats["hits"] / lookups, 4) if lookups else 0.0,
+        },
+        "principals": principal_cache.stats(),
+    }
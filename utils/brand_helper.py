@@ -0,0 +1,36 @@
+import re
+
+# Until db.migrations.backfill_brand_keys has finished, some documents may not
+# carry a brand_key yet, so lookups also match those by case-insensitive brand.
+_legacy_docs_present = True
+
+
+def normalize_brand(brand: str) -> str:
+    """Case-insensitive lookup key stored alongside every brand"""
+    return brand.casefold()
+
+
+def set_brand_keys_ready(ready: bool = True):
+    """Called by the backfill once every document has a brand_key"""
+    global _legacy_docs_present
+    _legacy_docs_present = not ready
+
+
+def brand_filter(brand: str) -> dict:
+    """Exact-match filter on the normalized brand key (an index seek)"""
+    exact = {"brand_key": normalize_brand(brand)}
+    if not _legacy_docs_present:
+        return exact
+    legacy = {
+        "brand_key": {"$exists": False},
+        "brand": {"$regex": f"^{re.escape(brand)}$", "$options": "i"},
+    }
+    return {"$or": [exact, legacy]}
+
+
+def brands_filter(brands) -> dict:
+    """Filter matching any of several brands"""
+    keys = [normalize_brand(b) for b in brands]
+    if not _legacy_docs_present:
+        return {"brand_key": {"$in": keys}}
+    return {"$or": [brand_filter(b) for b in brands]}
@@ -1,5 +1,9 @@
+import asyncio
+import fnmatch
 import json
-from typing import Any, Optional
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Iterable, Optional
 import os
 from dotenv import load_dotenv
 
@@ -16,11 +20,82 @@ load_dotenv()
 
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
 CACHE_TTL = int(os.getenv("CACHE_TTL", 300))  # 5 minutes default
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", 1000))
+# Catalog reads change on every sale; keep them short-lived so other workers converge quickly
+ITEMS_CACHE_TTL = int(os.getenv("ITEMS_CACHE_TTL", 30))
+
+
+class MemoryCache:
+    """Bounded in-process LRU with per-key TTL and tag-based invalidation"""
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (expires_at, value, tags)
+        self._tags: dict = {}  # tag -> set of keys
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key: str):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value, _ = entry
+        if expires_at <= time.monotonic():
+            self._drop(key)
+            self.expirations += 1
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any, ttl: int, tags: Iterable[str] = ()):
+        if key in self._data:
+            self._drop(key)
+        tags = tuple(tags)
+        self._data[key] = (time.monotonic() + ttl, value, tags)
+        for tag in tags:
+            self._tags.setdefault(tag, set()).add(key)
+        while len(self._data) > self.max_entries:
+            oldest = next(iter(self._data))
+            self._drop(oldest)
+            self.evictions += 1
+
+    def delete(self, key: str):
+        self._drop(key)
+
+    def invalidate_tag(self, tag: str) -> int:
+        keys = self._tags.pop(tag, set())
+        for key in keys:
+            self._drop(key)
+        return len(keys)
+
+    def keys_matching(self, pattern: str):
+        return [key for key in self._data if fnmatch.fnmatchcase(key, pattern)]
+
+    def _drop(self, key: str):
+        entry = self._data.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry[2]:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
 
 class CacheManager:
-    def __init__(self):
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES):
         self.redis = None
         self._connected = False
+        self.memory = MemoryCache(max_entries)
+        self._inflight: dict = {}  # key -> Future shared by concurrent loaders
+        self._tag_versions: dict = {}  # bumped on invalidation so in-flight loads don't store stale data
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
 
     async def connect(self):
         """Initialize Redis connection"""
@@ -48,10 +123,13 @@ class CacheManager:
     async def get(self, key: str) -> Optional[Any]:
         """Get value from cache"""
         if not self._connected:
-            return None
+            value = self.memory.get(key)
+            self._record(value is not None)
+            return value
 
         try:
             data = await self.redis.get(key)
+            self._record(bool(data))
             if data:
                 return json.loads(data)
             return None
@@ -59,14 +137,17 @@ class CacheManager:
             print(f"Cache get error: {e}")
             return None
 
-    async def set(self, key: str, value: Any, ttl: int = CACHE_TTL) -> bool:
-        """Set value in cache with TTL"""
+    async def set(self, key: str, value: Any, ttl: int = CACHE_TTL, tags: Iterable[str] = ()) -> bool:
+        """Set value in cache with TTL, optionally grouped under tags"""
         if not self._connected:
-            return False
+            self.memory.set(key, value, ttl, tags)
+            return True
 
         try:
-            data = json.dumps(value)
+            data = json.dumps(value, default=str)
             await self.redis.setex(key, ttl, data)
+            for tag in tags:
+                await self.redis.sadd(f"tag:{tag}", key)
             return True
         except Exception as e:
             print(f"Cache set error: {e}")
@@ -75,7 +156,8 @@ class CacheManager:
     async def delete(self, key: str) -> bool:
         """Delete key from cache"""
         if not self._connected:
-            return False
+            self.memory.delete(key)
+            return True
 
         try:
             await self.redis.delete(key)
@@ -84,11 +166,71 @@ class CacheManager:
             print(f"Cache delete error: {e}")
             return False
 
-    async def clear_pattern(self, pattern: str) -> bool:
-        """Clear all keys matching pattern"""
+    async def invalidate_tags(self, *tags: str) -> bool:
+        """Drop every key stored under any of the given tags"""
+        for tag in tags:
+            self._tag_versions[tag] = self._tag_versions.get(tag, 0) + 1
         if not self._connected:
+            for tag in tags:
+                self.memory.invalidate_tag(tag)
+            return True
+
+        try:
+            for tag in tags:
+                keys = await self.redis.smembers(f"tag:{tag}")
+                await self.redis.delete(f"tag:{tag}", *keys)
+            return True
+        except Exception as e:
+            print(f"Cache invalidate error: {e}")
             return False
 
+    async def get_or_load(
+        self,
+        key: str,
+        loader: Callable[[], Awaitable[Any]],
+        ttl: int = CACHE_TTL,
+        tags: Iterable[str] = (),
+    ) -> Any:
+        """
+        Return the cached value or run `loader` once to fill it.
+        Concurrent misses on the same key share a single load.
+        """
+        value = await self.get(key)
+        if value is not None:
+            return value
+
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self.coalesced += 1
+            return await asyncio.shield(pending)
+
+        tags = tuple(tags)
+        versions = [self._tag_versions.get(tag, 0) for tag in tags]
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await loader()
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark retrieved so an unawaited failure doesn't log a warning
+            future.exception()
+            raise
+        else:
+            future.set_result(value)
+            # Skip storing if a write invalidated these tags while we were loading
+            if value is not None and versions == [self._tag_versions.get(tag, 0) for tag in tags]:
+                await self.set(key, value, ttl, tags)
+            return value
+        finally:
+            del self._inflight[key]
+
+    async def clear_pattern(self, pattern: str) -> bool:
+        """Clear all keys matching pattern (prefer invalidate_tags)"""
+        if not self._connected:
+            for key in self.memory.keys_matching(pattern):
+                self.memory.delete(key)
+            return True
+
         try:
             keys = await self.redis.keys(pattern)
             if keys:
@@ -98,6 +240,27 @@ class CacheManager:
             print(f"Cache clear pattern error: {e}")
             return False
 
+    def _record(self, hit: bool):
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+    def stats(self) -> dict:
+        """Hit/miss/eviction counters for the cache"""
+        lookups = self.hits + self.misses
+        return {
+            "backend": "redis" if self._connected else "memory",
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "coalesced_loads": self.coalesced,
+            "evictions": self.memory.evictions,
+            "expirations": self.memory.expirations,
+            "entries": len(self.memory),
+            "max_entries": self.memory.max_entries,
+        }
+
 # Global cache instance
 cache_manager = CacheManager()
 
@@ -107,6 +270,13 @@ ITEM_DETAIL_KEY = "items:detail:{}"
 USER_DATA_KEY = "user:data:{}"
 SEARCH_RESULTS_KEY = "search:results:{}"
 ITEMS_COUNT_KEY = "items:count"
+ITEMS_PAGED_COUNT_KEY = "items:paged:count:{}"
+ITEM_SUMMARY_KEY = "items:summary:{}"
+
+# Cache tags
+ITEMS_TAG = "items"
+# Cart line summaries (id, brand, name, price); stock changes don't touch them
+ITEM_SUMMARY_TAG = "items:summary"
 
 def get_items_list_key():
     return ITEMS_LIST_KEY
@@ -114,6 +284,9 @@ def get_items_list_key():
 def get_item_detail_key(item_id: str):
     return ITEM_DETAIL_KEY.format(item_id)
 
+def get_item_summary_key(brand_key: str):
+    return ITEM_SUMMARY_KEY.format(brand_key)
+
 def get_user_data_key(username: str):
     return USER_DATA_KEY.format(username)
 
@@ -121,4 +294,7 @@ def get_search_results_key(query: str):
     return SEARCH_RESULTS_KEY.format(query)
 
 def get_items_count_key():
-    return ITEMS_COUNT_KEY
\ No newline at end of file
+    return ITEMS_COUNT_KEY
+
+def get_items_paged_count_key(filters: dict):
+    return ITEMS_PAGED_COUNT_KEY.format(json.dumps(filters, sort_keys=True, default=str))
@@ -0,0 +1,90 @@
+from pymongo import ReturnDocument
+from db.db import items_collection, carts_collection
+from utils.brand_helper import brand_filter, normalize_brand
+from utils.cache import cache_manager, get_item_summary_key, ITEMS_CACHE_TTL, ITEM_SUMMARY_TAG
+
+# Lines written before brand_key existed are matched on their lowercased brand
+_LINE_KEY = {"$ifNull": ["$$line.brand_key", {"$toLower": "$$line.brand"}]}
+_ITEMS = {"$ifNull": ["$items", []]}
+
+
+async def cart_item_summary(brand: str):
+    """Fields a cart line copies from the item, cached until the item itself is edited"""
+    return await cache_manager.get_or_load(
+        get_item_summary_key(normalize_brand(brand)),
+        lambda: _load_item_summary(brand),
+        ttl=ITEMS_CACHE_TTL,
+        tags=[ITEM_SUMMARY_TAG],
+    )
+
+async def _load_item_summary(brand: str):
+    item = await items_collection.find_one(
+        brand_filter(brand), {"_id": 0, "id": 1, "brand": 1, "name": 1, "price": 1}
+    )
+    if not item:
+        return None
+    return {
+        "item_id": item.get("id"),
+        "brand": item["brand"],
+        "brand_key": normalize_brand(item["brand"]),
+        "name": item["name"],
+        "price": item["price"],
+    }
+
+
+def _line_matches(key: str):
+    return {"$eq": [_LINE_KEY, {"$literal": key}]}
+
+
+def _line_with_quantity(quantity_expr):
+    return {
+        "item_id": "$$line.item_id",
+        "brand": "$$line.brand",
+        "brand_key": _LINE_KEY,
+        "name": "$$line.name",
+        "price": "$$line.price",
+        "quantity": quantity_expr,
+    }
+
+
+async def _apply(username: str, items_expr) -> dict:
+    """Replace the cart's items with `items_expr` in one atomic upsert"""
+    return await carts_collection.find_one_and_update(
+        {"username": username},
+        [{"$set": {"items": items_expr}}],
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+        projection={"_id": 0},
+    )
+
+
+async def add_cart_line(username: str, summary: dict, quantity: int) -> dict:
+    """Increment the brand's line, or append it if the cart doesn't have one"""
+    key = summary["brand_key"]
+    return await _apply(username, {"$let": {
+        "vars": {"lines": _ITEMS},
+        "in": {"$cond": [
+            {"$in": [{"$literal": key}, {"$map": {"input": "$$lines", "as": "line", "in": _LINE_KEY}}]},
+            {"$map": {"input": "$$lines", "as": "line", "in": {"$cond": [
+                _line_matches(key),
+                _line_with_quantity({"$add": ["$$line.quantity", quantity]}),
+                "$$line",
+            ]}}},
+            # $literal keeps brand or name values starting with "$" from being read as paths
+            {"$concatArrays": ["$$lines", {"$literal": [{**summary, "quantity": quantity}]}]},
+        ]},
+    }})
+
+
+async def set_cart_line(username: str, brand: str, quantity: int) -> dict:
+    """Set the brand's line quantity; zero or less removes the line"""
+    key = normalize_brand(brand)
+    if quantity <= 0:
+        items_expr = {"$filter": {"input": _ITEMS, "as": "line", "cond": {"$ne": [_LINE_KEY, {"$literal": key}]}}}
+    else:
+        items_expr = {"$map": {"input": _ITEMS, "as": "line", "in": {"$cond": [
+            _line_matches(key),
+            _line_with_quantity(quantity),
+            "$$line",
+        ]}}}
+    return await _apply(username, items_expr)
@@ -0,0 +1,122 @@
+import asyncio
+import os
+import time
+from datetime import datetime
+from pymongo import ReturnDocument
+from db.db import client, inventory_stats_collection, catalog_stats_collection
+from utils.cache import cache_manager, ITEMS_TAG, ITEM_SUMMARY_TAG
+
+CATALOG_VERSION_ID = "catalog_version"
+# How often each worker picks up versions bumped by other workers
+CATALOG_VERSION_REFRESH = int(os.getenv("CATALOG_VERSION_REFRESH", 2))
+
+
+class CatalogVersion:
+    """
+    Monotonic catalog version kept in Mongo so every worker agrees on it.
+    Item writes bump it, at most once per worker per refresh interval;
+    reads compare against the in-process copy.
+    """
+
+    def __init__(self):
+        self.current = None  # unknown until the first read from Mongo
+        self.writes = 0  # item writes seen by this worker
+        self.bumped_writes = 0  # writes the last bump covered
+        self.bumped_at = 0.0
+
+    async def _advance(self, version: int):
+        if self.current is not None and version <= self.current:
+            return
+        self.current = version
+        # Bodies cached under an older version would carry a stale ETag
+        await cache_manager.invalidate_tags(ITEMS_TAG)
+
+    @property
+    def dirty(self) -> bool:
+        """Written since the last bump; no ETag until one lands"""
+        return self.writes != self.bumped_writes
+
+    def bump_due(self) -> bool:
+        return time.monotonic() - self.bumped_at >= CATALOG_VERSION_REFRESH
+
+    async def bump(self):
+        # Writes landing during the round trip stay pending for the next bump
+        covered = self.writes
+        self.bumped_at = time.monotonic()
+        doc = await inventory_stats_collection.find_one_and_update(
+            {"_id": CATALOG_VERSION_ID},
+            {"$inc": {"version": 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        await self._advance(doc["version"])
+        self.bumped_writes = covered
+
+    async def refresh(self):
+        doc = await inventory_stats_collection.find_one({"_id": CATALOG_VERSION_ID})
+        await self._advance(doc["version"] if doc else 0)
+
+    def etag(self):
+        """Strong ETag for whole-catalog responses, or None while the version is unknown or behind"""
+        if self.current is None or self.dirty:
+            return None
+        return f'"v{self.current}"'
+
+    async def catalog_read(self, read):
+        """
+        Run `read(session)` for a whole-catalog body; returns (etag, result).
+        With secondary reads on, the version and the body are read in one
+        causally consistent session, so whichever secondary serves the body
+        has applied at least the version in the ETag. The body may be newer
+        than its ETag, never older; clients just refetch a little early.
+        """
+        if catalog_stats_collection is inventory_stats_collection:
+            # Primary reads: take the version first so a concurrent write can only make it older
+            return self.etag(), await read(None)
+        async with await client.start_session(causal_consistency=True) as session:
+            doc = await catalog_stats_collection.find_one(
+                {"_id": CATALOG_VERSION_ID}, {"version": 1}, session=session
+            )
+            return (f'"v{doc["version"]}"' if doc else None), await read(session)
+
+
+catalog_version = CatalogVersion()
+
+
+async def invalidate_catalog_cache(summaries: bool = False):
+    """
+    Drop cached item lists, details, counts and searches after any item write;
+    summaries=True also drops cart line summaries (create/edit/delete/import).
+    The shared version bump is coalesced: busy workers bump at most once per
+    CATALOG_VERSION_REFRESH and maintain_catalog_version sends the rest.
+    """
+    tags = (ITEMS_TAG, ITEM_SUMMARY_TAG) if summaries else (ITEMS_TAG,)
+    await cache_manager.invalidate_tags(*tags)
+    catalog_version.writes += 1
+    if not catalog_version.bump_due():
+        return
+    try:
+        await catalog_version.bump()
+    except Exception as e:
+        # Retried by maintain_catalog_version; never fail the write for it
+        print(f"Catalog version bump error: {e}")
+
+
+async def maintain_catalog_version(interval: int = CATALOG_VERSION_REFRESH):
+    """Send coalesced bumps and follow version bumps made by other workers"""
+    while True:
+        try:
+            if catalog_version.dirty:
+                await catalog_version.bump()
+            await catalog_version.refresh()
+        except Exception as e:
+            print(f"Catalog version refresh error: {e}")
+        await asyncio.sleep(interval)
+
+
+def item_etag(item: dict):
+    """Strong ETag for a single item, from its updated_at"""
+    updated_at = item.get("updated_at")
+    if not isinstance(updated_at, datetime):
+        return catalog_version.etag()  # items written before updated_at was tracked
+    return f'"i{updated_at.strftime("%Y%m%d%H%M%S%f")}"'
@@ -0,0 +1,128 @@
+from datetime import datetime
+import uuid
+from pymongo import UpdateOne
+from db.db import items_collection, purchases_collection
+from utils.brand_helper import brand_filter, brands_filter, normalize_brand
+from utils.inventory_helper import stock_delta, apply_stock_delta
+from utils.notification_helper import record_stock_notifications
+from utils.reservation_helper import reservation_ledger
+from utils.sales_helper import record_sales
+
+# Per-checkout scratch field on item documents; holds how many units a
+# checkout actually took (and the prior in_stock) so the result can be read
+# back after bulk_write.
+PENDING_FIELD = "pending_checkouts"
+
+
+def _merge_lines(lines):
+    """Collapse cart lines into {brand_key: (brand, quantity)}, keeping cart order"""
+    merged = {}
+    for entry in lines:
+        qty = int(entry.get("quantity", 1))
+        if qty > 0:
+            key = normalize_brand(entry["brand"])
+            brand, total = merged.get(key, (entry["brand"], 0))
+            merged[key] = (brand, total + qty)
+    return merged
+
+
+_HELD_UNITS = {"$sum": {"$map": {
+    "input": {"$objectToArray": {"$ifNull": ["$reserved", {}]}},
+    "in": {"$ifNull": ["$$this.v.units", 0]},
+}}}
+
+
+def _decrement_pipeline(token: str, qty: int):
+    """Aggregation-pipeline update: take min(qty, stock) units and refresh in_stock"""
+    pending = f"{PENDING_FIELD}.{token}"
+    return [
+        {"$set": {
+            f"{pending}.taken": {"$min": [qty, {"$max": ["$quantity", 0]}]},
+            f"{pending}.was_in_stock": "$in_stock",
+        }},
+        {"$set": {"quantity": {"$subtract": ["$quantity", f"${pending}.taken"]}}},
+        # Units other workers' ledgers hold are still in stock
+        {"$set": {"in_stock": {"$gt": [{"$add": ["$quantity", _HELD_UNITS]}, 0]}}},
+    ]
+
+
+async def bulk_checkout(lines):
+    """
+    Buy every cart line in a constant number of round trips.
+    Returns one result per unit, in cart order, like calling buy_item per unit.
+    """
+    wanted = _merge_lines(lines)
+    if not wanted:
+        return []
+
+    # Hot brands sell from units the ledger claimed first; its flush records
+    # those sales. Whatever it can't cover falls through to the item document.
+    from_ledger = {}
+    for key, (brand, qty) in wanted.items():
+        if reservation_ledger.is_hot(brand):
+            from_ledger[key], _ = await reservation_ledger.take(brand, qty)
+
+    token = uuid.uuid4().hex
+    decrements = [
+        UpdateOne({**brand_filter(brand), "quantity": {"$gt": 0}}, _decrement_pipeline(token, rest))
+        for key, (brand, qty) in wanted.items()
+        if (rest := qty - from_ledger.get(key, 0)) > 0
+    ]
+    if decrements:
+        await items_collection.bulk_write(decrements, ordered=False)
+
+    # Read back what each line actually took and the stock left afterwards
+    after = {}
+    cursor = items_collection.find(
+        brands_filter([brand for brand, _ in wanted.values()]),
+        {"_id": 0, "brand": 1, "name": 1, "price": 1, "quantity": 1, "in_stock": 1, "created_by": 1, PENDING_FIELD: 1},
+    )
+    async for doc in cursor:
+        after[normalize_brand(doc["brand"])] = doc
+    await items_collection.update_many(
+        {f"{PENDING_FIELD}.{token}": {"$exists": True}},
+        {"$unset": {f"{PENDING_FIELD}.{token}": ""}, "$set": {"updated_at": datetime.utcnow()}},
+    )
+
+    sales = []
+    notifications = []
+    taken_by_brand = {}
+    counters = {}
+    for key in wanted:
+        doc = after.get(key)
+        pending = (doc or {}).get(PENDING_FIELD, {}).get(token, {})
+        taken = int(pending.get("taken", 0))
+        taken_by_brand[key] = taken + from_ledger.get(key, 0)
+        if not taken:
+            continue
+        if pending.get("was_in_stock") and not doc.get("in_stock"):
+            for field, change in stock_delta(True, False).items():
+                counters[field] = counters.get(field, 0) + change
+        sales.append(UpdateOne(
+            brand_filter(doc["brand"]),
+            {"$inc": {"quantity_sold": taken}, "$set": {"brand": doc["brand"], "brand_key": key, "name": doc["name"]}},
+            upsert=True
+        ))
+        notifications.append((doc, taken))
+
+    if sales:
+        await purchases_collection.bulk_write(sales, ordered=False)
+    await record_stock_notifications(notifications)
+    await record_sales([(doc["brand"], taken, doc.get("price")) for doc, taken in notifications])
+    await apply_stock_delta(counters)
+
+    # Expand back into one result per unit so callers see the same shape as before
+    results = []
+    for entry in lines:
+        brand = entry["brand"]
+        key = normalize_brand(brand)
+        qty = int(entry.get("quantity", 1))
+        for _ in range(qty):
+            if key not in after:
+                results.append({"brand": brand, "status": "error", "detail": "Item not found"})
+            elif taken_by_brand.get(key, 0) > 0:
+                taken_by_brand[key] -= 1
+                results.append({"brand": brand, "status": "ok"})
+            else:
+                results.append({"brand": brand, "status": "error", "detail": "Out of stock"})
+    return results
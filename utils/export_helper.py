@@ -0,0 +1,47 @@
+import csv
+import io
+import os
+from db.db import items_collection
+from utils.response_helper import ITEM_FIELDS, ITEM_PROJECTION, item_view, dumps
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", 500))
+EXPORT_FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+async def iter_item_batches(query: dict, batch_size: int = EXPORT_BATCH_SIZE):
+    """Yield lists of response-shaped items straight off a Mongo cursor"""
+    cursor = items_collection.find(query, ITEM_PROJECTION).sort("brand", 1).batch_size(batch_size)
+    batch = []
+    async for doc in cursor:
+        batch.append(item_view(doc))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def ndjson_chunks(batches):
+    async for batch in batches:
+        yield "".join(dumps(item) + "\n" for item in batch)
+
+
+async def csv_chunks(batches):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=list(ITEM_FIELDS))
+    writer.writeheader()
+    async for batch in batches:
+        writer.writerows(batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def export_stream(fmt: str, query: dict):
+    """Chunk generator for StreamingResponse; memory stays at one batch"""
+    batches = iter_item_batches(query)
+    if fmt == "csv":
+        return csv_chunks(batches)
+    return ndjson_chunks(batches)
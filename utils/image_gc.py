@@ -0,0 +1,149 @@
+import asyncio
+import os
+import time
+from datetime import datetime
+from db.db import items_collection, deleted_items_collection
+from db.migrations import single_runner
+from utils.image_helper import (
+    UPLOAD_DIR, COMPRESSED_DIR, ORIGINALS_DIR, RENDITIONS_DIR, TMP_DIR, VARIANTS_DIR,
+    IMAGE_ID_PATTERN, variant_cache,
+)
+
+IMAGE_GC_INTERVAL = int(os.getenv("IMAGE_GC_INTERVAL", 3600))
+# Files younger than this are never collected: an upload writes its files before the item points at them
+IMAGE_GC_GRACE = int(os.getenv("IMAGE_GC_GRACE", 3600))
+IMAGE_GC_BATCH = int(os.getenv("IMAGE_GC_BATCH", 500))
+IMAGE_GC_DELETES_PER_SECOND = float(os.getenv("IMAGE_GC_DELETES_PER_SECOND", 50))
+# Pre-content-hash uploads carry no id, so they can only be expired by age
+IMAGE_GC_LEGACY_MAX_AGE_DAYS = int(os.getenv("IMAGE_GC_LEGACY_MAX_AGE_DAYS", 30))
+
+# Directories holding files named <image id>...; collected when the id is unreferenced
+_ID_DIRS = (ORIGINALS_DIR, RENDITIONS_DIR, VARIANTS_DIR)
+
+gc_stats = {
+    "runs": 0,
+    "last_run_at": None,
+    "last_duration_ms": None,
+    "scanned": 0,
+    "deleted": 0,
+    "deleted_bytes": 0,
+    "kept_referenced": 0,
+    "kept_recent": 0,
+    "errors": 0,
+    "last_error": None,
+}
+_gc_lock = asyncio.Lock()
+
+
+async def referenced_image_ids() -> set:
+    """Image ids still used by live items or kept in the deleted-items archive"""
+    ids = set()
+    for collection in (items_collection, deleted_items_collection):
+        ids.update(i for i in await collection.distinct("image_id") if i)
+    return ids
+
+
+def _next_batch(entries, size: int) -> list:
+    """Read up to `size` files from a scandir iterator; runs in a thread"""
+    batch = []
+    for entry in entries:
+        if entry.is_file(follow_symlinks=False):
+            stat = entry.stat(follow_symlinks=False)
+            batch.append((entry.name, entry.path, stat.st_mtime, stat.st_size))
+            if len(batch) >= size:
+                break
+    return batch
+
+
+def _is_garbage(directory: str, name: str, mtime: float, referenced: set, now: float, run: dict) -> bool:
+    if directory == TMP_DIR or name.endswith(".part"):
+        # Abandoned uploads and renders that died mid-write
+        return now - mtime >= IMAGE_GC_GRACE
+    if directory in _ID_DIRS:
+        image_id = name[:32]
+        if IMAGE_ID_PATTERN.match(image_id) and image_id in referenced:
+            run["kept_referenced"] += 1
+            return False
+        if now - mtime < IMAGE_GC_GRACE:
+            run["kept_recent"] += 1
+            return False
+        return True
+    return now - mtime >= IMAGE_GC_LEGACY_MAX_AGE_DAYS * 86400
+
+
+def _remove_unchanged(path: str, mtime: float) -> bool:
+    """Remove the file unless it was touched since it was scanned; runs in a thread"""
+    # A re-upload of the same content refreshes the mtime of the file it reuses
+    if os.stat(path, follow_symlinks=False).st_mtime != mtime:
+        return False
+    os.remove(path)
+    return True
+
+
+async def _delete(path: str, mtime: float, size: int, run: dict):
+    try:
+        removed = await asyncio.to_thread(_remove_unchanged, path, mtime)
+    except FileNotFoundError:
+        return  # another worker got there first
+    except OSError as e:
+        run["errors"] += 1
+        gc_stats["last_error"] = f"{path}: {e}"
+        return
+    if not removed:
+        run["kept_recent"] += 1
+        return
+    if path.startswith(VARIANTS_DIR):
+        variant_cache.forget(path)
+    run["deleted"] += 1
+    run["deleted_bytes"] += size
+    # Spread deletes out so a big cleanup never turns into an I/O spike
+    await asyncio.sleep(1 / IMAGE_GC_DELETES_PER_SECOND)
+
+
+async def collect_image_garbage() -> dict:
+    """
+    Delete upload files no item or archived item refers to. Directories are
+    streamed in batches off the event loop and deletes are rate-limited.
+    One worker runs it at a time; the others skip.
+    """
+    async with _gc_lock, single_runner("image_gc") as lease:
+        run = {key: 0 for key in ("scanned", "deleted", "deleted_bytes", "kept_referenced", "kept_recent", "errors")}
+        if lease is None:
+            return {**run, "skipped": True}
+        started = time.monotonic()
+        # Read the references before listing: anything attached later is newer than the grace period
+        referenced = await referenced_image_ids()
+        now = time.time()
+        for directory in (*_ID_DIRS, TMP_DIR, COMPRESSED_DIR, UPLOAD_DIR):
+            try:
+                entries = await asyncio.to_thread(os.scandir, directory)
+            except FileNotFoundError:
+                continue
+            with entries:
+                while batch := await asyncio.to_thread(_next_batch, entries, IMAGE_GC_BATCH):
+                    run["scanned"] += len(batch)
+                    for name, path, mtime, size in batch:
+                        if _is_garbage(directory, name, mtime, referenced, now, run):
+                            await _delete(path, mtime, size, run)
+                    await lease()
+
+        gc_stats["runs"] += 1
+        gc_stats["last_run_at"] = datetime.utcnow()
+        gc_stats["last_duration_ms"] = round((time.monotonic() - started) * 1000, 1)
+        for key, value in run.items():
+            gc_stats[key] += value
+        return run
+
+
+async def maintain_image_gc(interval: int = IMAGE_GC_INTERVAL):
+    while True:
+        # Sleep first so the scan never competes with startup
+        await asyncio.sleep(interval)
+        try:
+            run = await collect_image_garbage()
+            if run["deleted"]:
+                print(f"Image GC removed {run['deleted']} files ({run['deleted_bytes']} bytes)")
+        except Exception as e:
+            gc_stats["errors"] += 1
+            gc_stats["last_error"] = str(e)
+            print(f"Image GC error: {e}")
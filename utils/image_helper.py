@@ -1,74 +1,341 @@
+import asyncio
+import hashlib
+import multiprocessing
 import os
+import re
+from collections import OrderedDict
 import aiofiles
+from concurrent.futures import ProcessPoolExecutor
 from PIL import Image
 from typing import Tuple
 import uuid
 
 UPLOAD_DIR = "uploads"
-COMPRESSED_DIR = "uploads/compressed"
+COMPRESSED_DIR = "uploads/compressed"  # legacy single 800x600 rendition
+ORIGINALS_DIR = "uploads/originals"
+RENDITIONS_DIR = "uploads/renditions"
+TMP_DIR = "uploads/tmp"
+VARIANTS_DIR = "uploads/variants"  # on-demand sizes, bounded by IMAGE_CACHE_MAX_BYTES
 
 # Ensure directories exist
-os.makedirs(UPLOAD_DIR, exist_ok=True)
-os.makedirs(COMPRESSED_DIR, exist_ok=True)
+for _directory in (UPLOAD_DIR, COMPRESSED_DIR, ORIGINALS_DIR, RENDITIONS_DIR, TMP_DIR, VARIANTS_DIR):
+    os.makedirs(_directory, exist_ok=True)
 
-async def save_and_compress_image(file, filename: str, max_size: Tuple[int, int] = (800, 600), quality: int = 85) -> str:
+IMAGE_CHUNK_SIZE = 256 * 1024
+MAX_IMAGE_BYTES = int(os.getenv("MAX_IMAGE_BYTES", 20 * 1024 * 1024))
+# Decode/resize/encode is CPU-bound and holds the GIL, so it runs in processes
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", min(2, os.cpu_count() or 1)))
+IMAGE_MAX_PENDING = int(os.getenv("IMAGE_MAX_PENDING", 8))
+
+# name -> (bounding box, PIL format, file extension, encoder options)
+RENDITIONS = {
+    "thumb": ((200, 200), "JPEG", "jpg", {"quality": 80, "optimize": True}),
+    "medium": ((800, 600), "JPEG", "jpg", {"quality": 85, "optimize": True}),
+    "webp": ((800, 600), "WEBP", "webp", {"quality": 80, "method": 4}),
+}
+# On-demand variants: output format -> (PIL format, extension, media type, encoder options)
+VARIANT_FORMATS = {
+    "jpeg": ("JPEG", "jpg", "image/jpeg", {"quality": 85, "optimize": True}),
+    "webp": ("WEBP", "webp", "image/webp", {"quality": 80, "method": 4}),
+    "png": ("PNG", "png", "image/png", {"optimize": True}),
+}
+IMAGE_MAX_DIMENSION = int(os.getenv("IMAGE_MAX_DIMENSION", 2000))
+IMAGE_CACHE_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+IMAGE_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+ORIGINAL_EXTENSIONS = {"JPEG": "jpg", "PNG": "png", "WEBP": "webp", "GIF": "gif", "BMP": "bmp", "TIFF": "tif"}
+
+_executor = None
+_pending = 0
+_inflight: dict = {}  # image id -> Future shared by concurrent identical uploads
+
+
+class ImagePoolBusy(Exception):
+    """Raised when too many image jobs are already queued"""
+
+
+class InvalidImage(Exception):
+    """Upload is not a decodable image"""
+
+
+class ImageTooLarge(InvalidImage):
+    """Upload is over MAX_IMAGE_BYTES"""
+
+
+def _pool() -> ProcessPoolExecutor:
+    # Created on first use. Spawned, not forked: by then the event loop, motor's
+    # threads and their locks exist, and a forked child would inherit them mid-use
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=IMAGE_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _executor
+
+
+def rendition_path(image_id: str, name: str) -> str:
+    _, _, ext, _ = RENDITIONS[name]
+    return os.path.join(RENDITIONS_DIR, f"{image_id}_{name}.{ext}")
+
+
+def rendition_urls(image_id: str) -> dict:
+    return {name: "/" + rendition_path(image_id, name).replace(os.sep, "/") for name in RENDITIONS}
+
+
+def find_original(image_id: str):
+    for ext in ORIGINAL_EXTENSIONS.values():
+        path = os.path.join(ORIGINALS_DIR, f"{image_id}.{ext}")
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def _render_variant(source: str, dest: str, width: int, height: int, fmt: str) -> int:
+    """Runs in a worker process: resize to fit width x height (0 = unbounded)"""
+    pil_format, _, _, options = VARIANT_FORMATS[fmt]
+    with Image.open(source) as img:
+        box = (width or img.width, height or img.height)
+        img.draft("RGB", box)
+        if fmt == "jpeg" and img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        elif img.mode not in ("RGB", "RGBA", "L", "LA"):
+            img = img.convert("RGBA")
+        img.thumbnail(box, Image.Resampling.LANCZOS)
+        partial = f"{dest}.{os.getpid()}.part"
+        img.save(partial, pil_format, **options)
+        os.replace(partial, dest)
+    return os.path.getsize(dest)
+
+
+def _render_renditions(source: str, image_id: str) -> dict:
+    """Runs in a worker process: one decode, every rendition, atomic renames"""
+    largest = max((box for box, _, _, _ in RENDITIONS.values()), key=lambda b: b[0] * b[1])
+    with Image.open(source) as img:
+        original_format = img.format
+        width, height = img.size
+        # JPEG can decode at a reduced scale directly; much cheaper for big photos
+        img.draft("RGB", largest)
+        img = img.convert("RGB") if img.mode not in ("RGB", "L") else img
+        img.load()
+        for name, (box, fmt, _, options) in RENDITIONS.items():
+            rendition = img.copy()
+            rendition.thumbnail(box, Image.Resampling.LANCZOS)
+            path = rendition_path(image_id, name)
+            partial = f"{path}.{os.getpid()}.part"
+            rendition.save(partial, fmt, **options)
+            os.replace(partial, path)
+    return {"format": original_format, "width": width, "height": height}
+
+
+def shutdown_image_pool():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+async def _run(fn, *args):
+    global _pending
+    if _pending >= IMAGE_MAX_PENDING:
+        raise ImagePoolBusy()
+    _pending += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_pool(), fn, *args)
+    finally:
+        _pending -= 1
+
+
+async def _stream_to_temp(file) -> Tuple[str, str, int]:
+    """Copy the upload to disk chunk by chunk, hashing as it goes"""
+    digest = hashlib.sha256()
+    size = 0
+    temp_path = os.path.join(TMP_DIR, f"{uuid.uuid4().hex}.upload")
+    try:
+        async with aiofiles.open(temp_path, "wb") as f:
+            while chunk := await file.read(IMAGE_CHUNK_SIZE):
+                size += len(chunk)
+                if size > MAX_IMAGE_BYTES:
+                    raise ImageTooLarge(f"Image larger than {MAX_IMAGE_BYTES} bytes")
+                digest.update(chunk)
+                await f.write(chunk)
+    except BaseException:
+        _remove(temp_path)
+        raise
+    if not size:
+        _remove(temp_path)
+        raise InvalidImage("Empty upload")
+    return temp_path, digest.hexdigest()[:32], size
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _is_complete(image_id: str) -> bool:
+    """True if every file exists; refreshes their mtimes so the GC grace period restarts"""
+    paths = [find_original(image_id), *(rendition_path(image_id, name) for name in RENDITIONS)]
+    try:
+        for path in paths:
+            os.utime(path)
+    except (TypeError, FileNotFoundError):
+        return False
+    return True
+
+
+async def ingest_image(file) -> dict:
     """
-    Save uploaded image and create a compressed version
-    Returns the path to the compressed image
+    Store an uploaded image under its content hash and build every rendition.
+    Identical uploads are detected by hash and do no image work at all.
     """
-    # Generate unique filename
-    file_extension = os.path.splitext(filename)[1].lower()
-    unique_filename = f"{uuid.uuid4()}{file_extension}"
-    original_path = os.path.join(UPLOAD_DIR, unique_filename)
-    compressed_path = os.path.join(COMPRESSED_DIR, unique_filename)
-
-    # Save original file
-    async with aiofiles.open(original_path, 'wb') as f:
-        content = await file.read()
-        await f.write(content)
-
-    # Compress image
+    temp_path, image_id, size = await _stream_to_temp(file)
+    if _is_complete(image_id):
+        _remove(temp_path)
+        return {"image_id": image_id, "bytes": size, "deduplicated": True, "renditions": rendition_urls(image_id)}
+
+    pending = _inflight.get(image_id)
+    if pending is not None:
+        _remove(temp_path)
+        await asyncio.shield(pending)
+        return {"image_id": image_id, "bytes": size, "deduplicated": True, "renditions": rendition_urls(image_id)}
+
+    future = asyncio.get_running_loop().create_future()
+    _inflight[image_id] = future
     try:
-        with Image.open(original_path) as img:
-            # Convert to RGB if necessary
-            if img.mode in ("RGBA", "P"):
-                img = img.convert("RGB")
+        try:
+            info = await _run(_render_renditions, temp_path, image_id)
+        except ImagePoolBusy:
+            raise
+        except Exception as e:
+            raise InvalidImage(f"Could not process image ({type(e).__name__})") from e
+        ext = ORIGINAL_EXTENSIONS.get(info["format"], "bin")
+        os.replace(temp_path, os.path.join(ORIGINALS_DIR, f"{image_id}.{ext}"))
+        future.set_result(image_id)
+    except BaseException as e:
+        _remove(temp_path)
+        future.set_exception(e)
+        future.exception()  # retrieved, so an unawaited failure doesn't log a warning
+        raise
+    finally:
+        del _inflight[image_id]
+    return {"image_id": image_id, "bytes": size, "deduplicated": False, **info,
+            "renditions": rendition_urls(image_id)}
 
-            # Resize if larger than max_size
-            if img.size[0] > max_size[0] or img.size[1] > max_size[1]:
-                img.thumbnail(max_size, Image.Resampling.LANCZOS)
 
-            # Save compressed version
-            img.save(compressed_path, 'JPEG', quality=quality, optimize=True)
+class VariantCache:
+    """
+    Size-bounded LRU over the files in VARIANTS_DIR. Each worker tracks its
+    own view, seeded from the directory (oldest access first) on first use.
+    """
+
+    def __init__(self, max_bytes: int = IMAGE_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._files: "OrderedDict[str, int]" = OrderedDict()  # path -> size, least recent first
+        self._loaded = False
+        self._inflight: dict = {}  # path -> Future shared by concurrent requests for one variant
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
 
-        return compressed_path
+    def _load(self):
+        found = []
+        with os.scandir(VARIANTS_DIR) as entries:
+            for entry in entries:
+                if entry.is_file() and not entry.name.endswith(".part"):
+                    stat = entry.stat()
+                    found.append((stat.st_atime, entry.path, stat.st_size))
+        for _, path, size in sorted(found):
+            self._files[path] = size
+            self.bytes += size
+        self._loaded = True
+        self._evict()
+
+    def _touch(self, path: str) -> bool:
+        if path not in self._files:
+            return False
+        if not os.path.exists(path):  # evicted by another worker
+            self.bytes -= self._files.pop(path)
+            return False
+        self._files.move_to_end(path)
+        return True
+
+    def _add(self, path: str, size: int):
+        self.bytes += size - self._files.pop(path, 0)
+        self._files[path] = size
+        self._evict()
+
+    def _evict(self):
+        while self.bytes > self.max_bytes and len(self._files) > 1:
+            path, size = self._files.popitem(last=False)
+            self.bytes -= size
+            self.evictions += 1
+            _remove(path)
+
+    async def get(self, image_id: str, width: int, height: int, fmt: str) -> str:
+        """
+        Path of the variant, rendering it in the pool on a miss. Raises
+        FileNotFoundError for unknown images and ImagePoolBusy when saturated.
+        """
+        if not IMAGE_ID_PATTERN.match(image_id):
+            raise FileNotFoundError(image_id)
+        if not self._loaded:
+            self._load()
+        _, ext, _, _ = VARIANT_FORMATS[fmt]
+        path = os.path.join(VARIANTS_DIR, f"{image_id}_{width}x{height}.{ext}")
+        if self._touch(path):
+            self.hits += 1
+            return path
+
+        pending = self._inflight.get(path)
+        if pending is not None:
+            self.coalesced += 1
+            return await asyncio.shield(pending)
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[path] = future
+        try:
+            source = find_original(image_id)
+            if source is None:
+                raise FileNotFoundError(image_id)
+            size = await _run(_render_variant, source, path, width, height, fmt)
+            self._add(path, size)
+            future.set_result(path)
+            return path
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()
+            raise
+        finally:
+            del self._inflight[path]
+
+    def forget(self, path: str):
+        """Drop a file deleted behind the cache's back"""
+        self.bytes -= self._files.pop(path, 0)
+
+    def stats(self) -> dict:
+        return {
+            "files": len(self._files),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+        }
+
+
+variant_cache = VariantCache()
+
+
+def variant_etag(image_id: str, width: int, height: int, fmt: str) -> str:
+    # Image ids are content hashes, so a variant's bytes never change
+    return f'"{image_id}-{width}x{height}-{fmt}"'
 
-    except Exception as e:
-        print(f"Image compression error: {e}")
-        # Return original path if compression fails
-        return original_path
 
 def get_image_path(filename: str, compressed: bool = True) -> str:
     """Get the path to an image file"""
     if compressed:
         return os.path.join(COMPRESSED_DIR, filename)
     return os.path.join(UPLOAD_DIR, filename)
-
-def cleanup_old_images(max_age_days: int = 30):
-    """Clean up old uploaded images (optional maintenance function)"""
-    import time
-    import glob
-
-    current_time = time.time()
-    max_age = max_age_days * 24 * 60 * 60
-
-    for directory in [UPLOAD_DIR, COMPRESSED_DIR]:
-        for filepath in glob.glob(os.path.join(directory, '*')):
-            if os.path.isfile(filepath):
-                file_age = current_time - os.path.getmtime(filepath)
-                if file_age > max_age:
-                    try:
-                        os.remove(filepath)
-                        print(f"Cleaned up old image: {filepath}")
-                    except Exception as e:
-                        print(f"Error cleaning up {filepath}: {e}")
\ No newline at end of file
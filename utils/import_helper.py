@@ -0,0 +1,243 @@
+import codecs
+import csv
+import json
+import os
+import uuid
+from datetime import datetime
+from pydantic import ValidationError
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError
+from db.db import items_collection
+from utils.brand_helper import normalize_brand
+from utils.inventory_helper import stock_delta
+from utils.reservation_helper import reservation_ledger, RESET_RESERVATIONS
+from utils.search_helper import item_search_index
+
+BULK_BATCH_SIZE = int(os.getenv("BULK_BATCH_SIZE", 500))
+ITEM_LIMITS = {"admin": 10, "superadmin": 100}
+IMPORT_FORMATS = ("json", "ndjson", "csv")
+# Item fields an upsert never overwrites: ownership, the attached image, and in_stock (derived from quantity)
+_NOT_IMPORTED = ("created_by", "image_id", "in_stock")
+
+
+def detect_format(content_type: str, filename: str = "") -> str:
+    """Pick json/ndjson/csv from a filename or content type"""
+    filename = (filename or "").lower()
+    content_type = (content_type or "").lower()
+    if filename.endswith(".csv") or "csv" in content_type:
+        return "csv"
+    if filename.endswith((".ndjson", ".jsonl")) or "ndjson" in content_type or "jsonl" in content_type:
+        return "ndjson"
+    return "json"
+
+
+async def _text_lines(chunks):
+    """Decode a byte stream incrementally and yield complete lines"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line + "\n"
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+
+async def _ndjson_rows(chunks):
+    number = 0
+    async for line in _text_lines(chunks):
+        if not line.strip():
+            continue
+        number += 1
+        try:
+            yield number, json.loads(line)
+        except ValueError as e:
+            yield number, ValueError(f"Invalid JSON: {e}")
+
+
+async def _csv_rows(chunks):
+    header = None
+    record = ""
+    number = 0
+    async for line in _text_lines(chunks):
+        record += line
+        # An odd number of quotes means a quoted field continues on the next line
+        if record.count('"') % 2:
+            continue
+        fields = next(csv.reader([record]), [])
+        record = ""
+        if not any(field.strip() for field in fields):
+            continue
+        if header is None:
+            header = [field.strip() for field in fields]
+            continue
+        number += 1
+        yield number, {k: v for k, v in zip(header, fields) if v != ""}
+
+
+async def _json_rows(chunks):
+    # A JSON array has to be parsed whole; use NDJSON or CSV for very large loads
+    body = b"".join([chunk async for chunk in chunks])
+    try:
+        rows = json.loads(body or b"[]")
+    except ValueError as e:
+        yield 0, ValueError(f"Invalid JSON: {e}")
+        return
+    if not isinstance(rows, list):
+        yield 0, ValueError("Expected a JSON array of items")
+        return
+    for number, row in enumerate(rows, start=1):
+        yield number, row
+
+
+def iter_rows(fmt: str, chunks):
+    """(row_number, dict | ValueError) pairs from a byte-chunk stream"""
+    if fmt == "csv":
+        return _csv_rows(chunks)
+    if fmt == "ndjson":
+        return _ndjson_rows(chunks)
+    return _json_rows(chunks)
+
+
+class BulkImport:
+    """Validates rows in batches and writes each batch in one round trip"""
+
+    def __init__(self, user: dict, model, mode: str = "insert"):
+        self.user = user
+        self.model = model
+        self.upsert = mode == "upsert"
+        self.limit = ITEM_LIMITS.get(user["role"])
+        self.owned = None  # items already created by this user
+        self.seen = set()  # brand keys earlier in this upload
+        self.inserted = 0
+        self.updated = 0
+        self.errors = []
+        self.counters = {}
+
+    def _error(self, number, row, detail):
+        brand = row.get("brand") if isinstance(row, dict) else None
+        self.errors.append({"row": number, "brand": brand, "detail": detail})
+
+    async def run(self, rows):
+        batch = []
+        async for number, row in rows:
+            if isinstance(row, Exception):
+                self._error(number, None, str(row))
+                continue
+            batch.append((number, row))
+            if len(batch) >= BULK_BATCH_SIZE:
+                await self._write_batch(batch)
+                batch = []
+        if batch:
+            await self._write_batch(batch)
+        return {
+            "inserted": self.inserted,
+            "updated": self.updated,
+            "failed": len(self.errors),
+            "errors": sorted(self.errors, key=lambda err: err["row"]),
+        }
+
+    def _validate(self, batch):
+        valid = []
+        for number, row in batch:
+            if not isinstance(row, dict):
+                self._error(number, None, "Row must be an object")
+                continue
+            try:
+                item = self.model(**row)
+            except ValidationError as e:
+                self._error(number, row, "; ".join(
+                    f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" for err in e.errors()
+                ))
+                continue
+            key = normalize_brand(item.brand)
+            if key in self.seen:
+                self._error(number, row, "Duplicate brand in upload")
+                continue
+            self.seen.add(key)
+            valid.append((number, key, item))
+        return valid
+
+    async def _precheck(self, keys):
+        """One aggregation: which brands already exist, and how many items this user owns"""
+        pipeline = [
+            {"$match": {"$or": [{"brand_key": {"$in": keys}}, {"created_by": self.user["username"]}]}},
+            {"$facet": {
+                "existing": [
+                    {"$match": {"brand_key": {"$in": keys}}},
+                    {"$project": {"_id": 0, "brand_key": 1, "in_stock": 1}},
+                ],
+                "owned": [{"$match": {"created_by": self.user["username"]}}, {"$count": "n"}],
+            }},
+        ]
+        result = (await items_collection.aggregate(pipeline).to_list(length=1))[0]
+        existing = {doc["brand_key"]: doc.get("in_stock") for doc in result["existing"]}
+        owned = result["owned"][0]["n"] if result["owned"] else 0
+        return existing, owned
+
+    def _add_delta(self, delta):
+        for field, change in delta.items():
+            self.counters[field] = self.counters.get(field, 0) + change
+
+    async def _write_batch(self, batch):
+        valid = self._validate(batch)
+        if not valid:
+            return
+        existing, owned = await self._precheck([key for _, key, _ in valid])
+        if self.owned is None:
+            self.owned = owned
+
+        ops, meta = [], []
+        now = datetime.utcnow()
+        for number, key, item in valid:
+            doc = item.dict()
+            doc["brand_key"] = key
+            doc["in_stock"] = item.quantity > 0
+            doc["updated_at"] = now
+            if key in existing:
+                if not self.upsert:
+                    self._error(number, doc, "Brand already exists")
+                    continue
+                # Only what the row provided; defaults would detach images and the like
+                doc = {
+                    field: value for field, value in item.dict(exclude_unset=True).items()
+                    if field not in _NOT_IMPORTED
+                }
+                doc.update(brand_key=key, in_stock=item.quantity > 0, updated_at=now, updated_by=self.user["username"])
+                # Imported quantities are absolute, as in a PUT
+                await reservation_ledger.reset(key)
+                ops.append(UpdateOne({"brand_key": key}, {"$set": doc, "$unset": RESET_RESERVATIONS}))
+                meta.append((number, doc, stock_delta(existing[key], doc["in_stock"])))
+                continue
+            if self.limit is not None and self.owned >= self.limit:
+                self._error(number, doc, "Reached your limit")
+                continue
+            self.owned += 1
+            doc["id"] = str(uuid.uuid4())
+            doc["created_by"] = self.user["username"]
+            ops.append(InsertOne(doc))
+            meta.append((number, doc, stock_delta(None, doc["in_stock"])))
+
+        if not ops:
+            return
+        failed = {}
+        try:
+            await items_collection.bulk_write(ops, ordered=False)
+        except BulkWriteError as e:
+            for err in e.details.get("writeErrors", []):
+                failed[err["index"]] = "Brand already exists" if err.get("code") == 11000 else err.get("errmsg")
+        # Index each batch as it lands, so no document outlives its batch
+        for index, (number, doc, delta) in enumerate(meta):
+            if index in failed:
+                self._error(number, doc, failed[index])
+                if isinstance(ops[index], InsertOne):
+                    self.owned -= 1
+                continue
+            if isinstance(ops[index], InsertOne):
+                self.inserted += 1
+            else:
+                self.updated += 1
+            self._add_delta(delta)
+            item_search_index.upsert(doc)
@@ -0,0 +1,62 @@
+import asyncio
+from db.db import items_collection, inventory_stats_collection
+
+# Single counters document maintained by every item write path
+STATS_ID = "inventory"
+STATS_FIELDS = ("total_items", "in_stock", "out_of_stock")
+_COMPLETE = {field: {"$exists": True} for field in STATS_FIELDS}
+
+
+def stock_delta(was_in_stock=None, now_in_stock=None) -> dict:
+    """
+    Counter changes for an item moving between states.
+    None means the item did not exist before (create) or after (delete).
+    """
+    delta = {"total_items": 0, "in_stock": 0, "out_of_stock": 0}
+    for state, sign in ((was_in_stock, -1), (now_in_stock, 1)):
+        if state is None:
+            continue
+        delta["total_items"] += sign
+        delta["in_stock" if state else "out_of_stock"] += sign
+    return {k: v for k, v in delta.items() if v}
+
+
+async def apply_stock_delta(delta: dict):
+    """
+    Atomically add a stock_delta() to the counters document. Never upserts:
+    a document created from one delta would hold only that delta, so a
+    missing or partial document is rebuilt from the items instead.
+    """
+    if not delta:
+        return
+    result = await inventory_stats_collection.update_one({"_id": STATS_ID, **_COMPLETE}, {"$inc": delta})
+    if not result.matched_count:
+        await reconcile_inventory_stats()
+
+
+async def reconcile_inventory_stats() -> dict:
+    """Rebuild the counters from the items collection with one $facet aggregation"""
+    pipeline = [
+        {"$facet": {
+            "total_items": [{"$count": "n"}],
+            "in_stock": [{"$match": {"in_stock": True}}, {"$count": "n"}],
+            "out_of_stock": [{"$match": {"in_stock": False}}, {"$count": "n"}],
+        }}
+    ]
+    result = (await items_collection.aggregate(pipeline).to_list(length=1))[0]
+    counts = {key: (rows[0]["n"] if rows else 0) for key, rows in result.items()}
+    await inventory_stats_collection.replace_one({"_id": STATS_ID}, counts, upsert=True)
+    return counts
+
+
+async def get_inventory_stats() -> dict:
+    """Current counters; rebuilt if the document is missing or lacks a counter"""
+    stats = await inventory_stats_collection.find_one({"_id": STATS_ID}, {"_id": 0})
+    if stats is None or any(field not in stats for field in STATS_FIELDS):
+        return await reconcile_inventory_stats()
+    return {field: stats[field] for field in STATS_FIELDS}
+
+
+if __name__ == "__main__":
+    # python -m utils.inventory_helper  -> rebuild the counters
+    print(asyncio.run(reconcile_inventory_stats()))
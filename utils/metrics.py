@@ -0,0 +1,319 @@
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from typing import Callable, Iterable, Tuple
+from fastapi.exceptions import RequestValidationError
+from fastapi.routing import APIRoute
+from pymongo import monitoring
+from starlette.exceptions import HTTPException
+
+# Prometheus metrics kept in plain dicts and lists, with no locks. Request
+# metrics are only touched from the event loop; Mongo listeners run on
+# motor's worker threads, where the GIL makes each update effectively atomic.
+# A rare lost increment under heavy contention is the price of no locking.
+
+# Seconds; covers a cached read (~1ms) up to a slow import or export
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_text(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric(ABC):
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._children: dict = {}  # label values -> child
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            # setdefault keeps one child even if two threads race on the first use
+            child = self._children.setdefault(values, self._new_child())
+        return child
+
+    @abstractmethod
+    def _new_child(self):
+        """Per label-set value holder"""
+
+    @abstractmethod
+    def _render_child(self, values, child) -> list:
+        """Exposition lines for one label set"""
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in list(self._children.items()):
+            lines.extend(self._render_child(values, child))
+        return lines
+
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def dec(self, amount: float = 1):
+        self.value -= amount
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def _render_child(self, values, child):
+        return [f"{self.name}_total{_label_text(self.labelnames, values)} {_number(child.value)}"]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def _render_child(self, values, child):
+        return [f"{self.name}{_label_text(self.labelnames, values)} {_number(child.value)}"]
+
+
+class _Buckets:
+    __slots__ = ("bounds", "counts", "sum", "max")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # per bucket, not cumulative; last is +Inf
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Iterable[str] = (), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _Buckets(self.buckets)
+
+    def _render_child(self, values, child):
+        lines = []
+        counts = list(child.counts)
+        cumulative = 0
+        for bound, count in zip((*self.buckets, float("inf")), counts):
+            cumulative += count
+            le = _label_text(self.labelnames, values, f'le="{_number(bound)}"')
+            lines.append(f"{self.name}_bucket{le} {cumulative}")
+        labels = _label_text(self.labelnames, values)
+        lines.append(f"{self.name}_sum{labels} {_number(child.sum)}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: list = []
+        # Called at scrape time; yield (name, type, help, [(labels dict, value)])
+        self._collectors: list = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector: Callable):
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            try:
+                families = list(collector())
+            except Exception as e:
+                print(f"Metrics collector error: {e}")
+                continue
+            for name, kind, help_text, samples in families:
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                suffix = "_total" if kind == "counter" else ""
+                for labels, value in samples:
+                    names = tuple(labels)
+                    lines.append(f"{name}{suffix}{_label_text(names, tuple(labels[n] for n in names))} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_request_duration = registry.register(Histogram(
+    "http_request_duration_seconds", "Request latency by route template, event streams excluded", ("method", "route")))
+http_requests = registry.register(Counter(
+    "http_requests", "Requests by route template and status code", ("method", "route", "status")))
+http_requests_in_flight = registry.register(Gauge(
+    "http_requests_in_flight", "Requests being handled, including open streams", ("method", "route")))
+
+mongo_command_duration = registry.register(Histogram(
+    "mongo_command_duration_seconds", "Mongo command round trip", ("collection", "command")))
+mongo_command_failures = registry.register(Counter(
+    "mongo_command_failures", "Mongo commands that returned an error", ("collection", "command")))
+mongo_pool_checkout_wait = registry.register(Histogram(
+    "mongo_pool_checkout_wait_seconds", "Time spent waiting for a pooled connection", ("address",)))
+mongo_pool_checkout_failures = registry.register(Counter(
+    "mongo_pool_checkout_failures", "Connection checkouts that failed or timed out", ("address", "reason")))
+mongo_pool_checked_out = registry.register(Gauge(
+    "mongo_pool_checked_out", "Connections currently checked out of the pool", ("address",)))
+mongo_pool_waiters = registry.register(Gauge(
+    "mongo_pool_waiters", "Operations waiting for a pooled connection", ("address",)))
+mongo_pool_connections = registry.register(Gauge(
+    "mongo_pool_connections", "Open connections, idle or in use", ("address",)))
+mongo_pool_cleared = registry.register(Counter(
+    "mongo_pool_cleared", "Times the pool was cleared after a server error", ("address",)))
+
+
+class MetricsRoute(APIRoute):
+    """APIRoute that times every request under its path template, so labels stay bounded"""
+
+    async def handle(self, scope, receive, send):
+        method = scope["method"]
+        in_flight = http_requests_in_flight.labels(method, self.path_format)
+        status = 500
+        streaming = False
+
+        async def send_with_status(message):
+            nonlocal status, streaming
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                streaming = any(name == b"content-type" and value.startswith(b"text/event-stream")
+                                for name, value in message.get("headers", []))
+            await send(message)
+
+        in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await super().handle(scope, receive, send_with_status)
+        # Both are turned into responses by the exception handlers further out
+        except HTTPException as e:
+            status = e.status_code
+            raise
+        except RequestValidationError:
+            status = 422
+            raise
+        finally:
+            in_flight.dec()
+            # An event stream lasts as long as the client listens; timing it would swamp the latency buckets
+            if not streaming:
+                http_request_duration.labels(method, self.path_format).observe(time.perf_counter() - started)
+            http_requests.labels(method, self.path_format, status).inc()
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Per collection/command latency from pymongo command monitoring"""
+
+    def __init__(self):
+        self._pending: dict = {}  # (connection, request id) -> (collection, command)
+
+    def started(self, event):
+        target = event.command.get(event.command_name)
+        if event.command_name == "getMore":
+            target = event.command.get("collection")
+        collection = target if isinstance(target, str) else "-"
+        self._pending[(event.connection_id, event.request_id)] = (collection, event.command_name)
+
+    def _finish(self, event):
+        return self._pending.pop((event.connection_id, event.request_id), ("-", event.command_name))
+
+    def succeeded(self, event):
+        mongo_command_duration.labels(*self._finish(event)).observe(event.duration_micros / 1e6)
+
+    def failed(self, event):
+        labels = self._finish(event)
+        mongo_command_duration.labels(*labels).observe(event.duration_micros / 1e6)
+        mongo_command_failures.labels(*labels).inc()
+
+
+class MongoPoolMetrics(monitoring.ConnectionPoolListener):
+    """Checkout wait time and live pool occupancy, per server"""
+
+    def connection_check_out_started(self, event):
+        mongo_pool_waiters.labels(_address(event.address)).inc()
+
+    def connection_checked_out(self, event):
+        address = _address(event.address)
+        mongo_pool_waiters.labels(address).dec()
+        mongo_pool_checked_out.labels(address).inc()
+        mongo_pool_checkout_wait.labels(address).observe(event.duration)
+
+    def connection_check_out_failed(self, event):
+        address = _address(event.address)
+        mongo_pool_waiters.labels(address).dec()
+        mongo_pool_checkout_wait.labels(address).observe(event.duration)
+        mongo_pool_checkout_failures.labels(address, event.reason).inc()
+
+    def connection_checked_in(self, event):
+        mongo_pool_checked_out.labels(_address(event.address)).dec()
+
+    def connection_created(self, event):
+        mongo_pool_connections.labels(_address(event.address)).inc()
+
+    def connection_closed(self, event):
+        mongo_pool_connections.labels(_address(event.address)).dec()
+
+    def pool_cleared(self, event):
+        mongo_pool_cleared.labels(_address(event.address)).inc()
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+
+def _address(address) -> str:
+    host, port = address
+    return f"{host}:{port}"
+
+
+def pool_stats() -> dict:
+    """Per-server pool occupancy and checkout wait, from the pool events seen so far"""
+    stats = {}
+    for (address,), wait in list(mongo_pool_checkout_wait._children.items()):
+        checkouts = sum(wait.counts)
+        stats[address] = {
+            "checkouts": checkouts,
+            "wait_seconds_avg": round(wait.sum / checkouts, 6) if checkouts else 0.0,
+            "wait_seconds_max": wait.max,
+        }
+    for name, metric in (("checked_out", mongo_pool_checked_out), ("waiters", mongo_pool_waiters),
+                         ("connections", mongo_pool_connections), ("cleared", mongo_pool_cleared)):
+        for (address,), child in list(metric._children.items()):
+            stats.setdefault(address, {})[name] = child.value
+    for (address, reason), child in list(mongo_pool_checkout_failures._children.items()):
+        stats.setdefault(address, {}).setdefault("checkout_failures", {})[reason] = child.value
+    return stats
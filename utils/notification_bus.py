@@ -0,0 +1,147 @@
+import asyncio
+import os
+from datetime import datetime, timedelta
+from bson import ObjectId
+from bson.errors import InvalidId
+from utils.response_helper import dumps
+
+# Events buffered per open stream before it is treated as a slow consumer
+STREAM_BUFFER_SIZE = int(os.getenv("STREAM_BUFFER_SIZE", 100))
+# Seconds between keep-alive comments on an idle stream
+STREAM_KEEPALIVE = int(os.getenv("STREAM_KEEPALIVE", 15))
+
+EPOCH = datetime(1970, 1, 1)
+
+
+class Subscription:
+    """One open stream: a bounded queue of events for a single owner"""
+
+    def __init__(self, owner: str, maxsize: int = STREAM_BUFFER_SIZE):
+        self.owner = owner
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.overflowed = False
+
+    def offer(self, event: dict):
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Don't buffer without bound or block publishers; the stream closes
+            # and the client resumes from its last id, replayed from Mongo.
+            self.overflowed = True
+            self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+
+class NotificationBus:
+    """In-process pub/sub fanning events out per created_by"""
+
+    def __init__(self):
+        self._subscribers: dict = {}  # owner -> set of Subscription
+        self.published = 0
+        self.overflows = 0
+
+    def subscribe(self, owner: str) -> Subscription:
+        subscription = Subscription(owner)
+        self._subscribers.setdefault(owner, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        subscribers = self._subscribers.get(subscription.owner)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[subscription.owner]
+
+    def has_subscribers(self, owner: str) -> bool:
+        return bool(self._subscribers.get(owner))
+
+    def publish(self, owner: str, event_type: str, data: dict, event_id: str = None):
+        """Deliver to every stream of `owner`; never blocks the publisher"""
+        subscribers = self._subscribers.get(owner)
+        if not subscribers:
+            return
+        self.published += 1
+        event = {"event": event_type, "id": event_id, "data": data}
+        for subscription in list(subscribers):
+            was_overflowed = subscription.overflowed
+            subscription.offer(event)
+            if subscription.overflowed and not was_overflowed:
+                self.overflows += 1
+
+    def stats(self) -> dict:
+        return {
+            "owners": len(self._subscribers),
+            "connections": sum(len(s) for s in self._subscribers.values()),
+            "published": self.published,
+            "overflows": self.overflows,
+        }
+
+
+notification_bus = NotificationBus()
+
+
+def event_id(doc: dict):
+    """`<_id>:<notified_at ms>`, so a notification updated in place gets a new position"""
+    if doc.get("_id") is None:
+        return None
+    notified_at = doc.get("notified_at")
+    if not isinstance(notified_at, datetime):
+        return str(doc["_id"])
+    return f"{doc['_id']}:{(notified_at - EPOCH) // timedelta(milliseconds=1)}"
+
+
+def parse_event_id(value: str):
+    """(notified_at, _id) to resume after; raises ValueError for anything malformed"""
+    oid, _, millis = value.partition(":")
+    try:
+        oid = ObjectId(oid)
+    except (InvalidId, TypeError):
+        raise ValueError(value)
+    if not millis:
+        return oid.generation_time.replace(tzinfo=None), oid
+    return EPOCH + timedelta(milliseconds=int(millis)), oid
+
+
+def notification_data(doc: dict) -> dict:
+    """Client shape of a stored notification: string id, bookkeeping dropped"""
+    data = {k: v for k, v in doc.items() if k not in ("_id", "coalesce_until")}
+    if doc.get("_id") is not None:
+        data["id"] = str(doc["_id"])
+    return data
+
+
+def publish_notification(doc: dict):
+    """Publish a stored notification document"""
+    notification_bus.publish(doc.get("created_by"), "notification", notification_data(doc), event_id(doc))
+
+
+def publish_item_event(owner: str, action: str, item: dict):
+    """Tell the owner's open streams that one of their items changed"""
+    if not owner or not item:
+        return
+    notification_bus.publish(owner, "item", {
+        "action": action,
+        "brand": item.get("brand"),
+        "name": item.get("name"),
+        "quantity": item.get("quantity"),
+        "in_stock": item.get("in_stock"),
+    })
+
+
+def publish_import_event(owner: str, summary: dict):
+    """One event for a whole bulk import; a row per event would overflow open streams"""
+    if not owner or not (summary["inserted"] or summary["updated"]):
+        return
+    notification_bus.publish(owner, "item", {
+        "action": "imported",
+        "inserted": summary["inserted"],
+        "updated": summary["updated"],
+    })
+
+
+def format_sse(event_type: str, data: dict, event_id: str = None) -> str:
+    """One Server-Sent Events frame"""
+    frame = f"id: {event_id}\n" if event_id else ""
+    return frame + f"event: {event_type}\ndata: {dumps(data)}\n\n"
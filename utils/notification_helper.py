@@ -0,0 +1,96 @@
+import os
+from datetime import datetime, timedelta
+from pymongo import InsertOne, UpdateOne
+from db.db import notifications_collection
+from utils.brand_helper import normalize_brand
+from utils.notification_bus import notification_bus, publish_notification
+
+LOW_STOCK_THRESHOLD = 3
+# Sales of one brand inside the window update a single notification in place
+NOTIFICATION_COALESCE = os.getenv("NOTIFICATION_COALESCE", "1") != "0"
+NOTIFICATION_WINDOW = int(os.getenv("NOTIFICATION_WINDOW", 300))
+# Oldest notifications beyond this many per owner are deleted
+NOTIFICATIONS_MAX_PER_USER = int(os.getenv("NOTIFICATIONS_MAX_PER_USER", 500))
+
+
+def stock_level(quantity: int) -> str:
+    if quantity <= 0:
+        return "out_of_stock"
+    if quantity < LOW_STOCK_THRESHOLD:
+        return "low_stock"
+    return "stock_update"
+
+
+def stock_message(name: str, quantity: int) -> str:
+    if quantity < LOW_STOCK_THRESHOLD:
+        return f"{name} stock is low: {quantity} left"
+    return f"{name} updated stock"
+
+
+def coalesce_filter(owner: str, brand_key: str, level: str, now: datetime) -> dict:
+    """The open entry a sale at this stock level is merged into"""
+    return {"created_by": owner, "brand_key": brand_key, "level": level, "coalesce_until": {"$gt": now}}
+
+
+def _stock_op(item: dict, sold: int, now: datetime):
+    owner = item.get("created_by", "system")
+    quantity = item["quantity"]
+    level = stock_level(quantity)
+    fields = {
+        "brand": item["brand"],
+        "brand_key": normalize_brand(item["brand"]),
+        "name": item["name"],
+        "quantity": quantity,
+        "in_stock": item.get("in_stock", quantity > 0),
+        "created_by": owner,
+        "level": level,
+        "msg": stock_message(item["name"], quantity),
+        "notified_at": now,
+    }
+    window_end = now + timedelta(seconds=NOTIFICATION_WINDOW)
+    # Crossing into low / out of stock is actionable, so it always starts a new entry
+    if not NOTIFICATION_COALESCE or level != stock_level(quantity + sold):
+        return InsertOne({**fields, "sales": sold, "coalesce_until": window_end})
+    return UpdateOne(
+        coalesce_filter(owner, fields["brand_key"], level, now),
+        {"$set": fields, "$inc": {"sales": sold}, "$setOnInsert": {"coalesce_until": window_end}},
+        upsert=True,
+    )
+
+
+async def record_stock_notifications(sales):
+    """
+    Write the notifications for (item_after_sale, units_sold) pairs in one round trip,
+    then publish them to open streams.
+    """
+    if not sales:
+        return
+    now = datetime.utcnow()
+    result = await notifications_collection.bulk_write(
+        [_stock_op(item, sold, now) for item, sold in sales], ordered=False
+    )
+
+    owners = {item.get("created_by", "system") for item, _ in sales}
+    if result.inserted_count or result.upserted_count:
+        for owner in owners:
+            await _enforce_cap(owner)
+
+    listening = [owner for owner in owners if notification_bus.has_subscribers(owner)]
+    if listening:
+        cursor = notifications_collection.find({
+            "created_by": {"$in": listening},
+            "brand_key": {"$in": [normalize_brand(item["brand"]) for item, _ in sales]},
+            "notified_at": now,
+        }, {"coalesce_until": 0})
+        async for doc in cursor:
+            publish_notification(doc)
+
+
+async def _enforce_cap(owner: str):
+    cutoff = await notifications_collection.find(
+        {"created_by": owner}, {"_id": 0, "notified_at": 1}
+    ).sort("notified_at", -1).skip(NOTIFICATIONS_MAX_PER_USER).limit(1).to_list(length=1)
+    if cutoff:
+        await notifications_collection.delete_many(
+            {"created_by": owner, "notified_at": {"$lte": cutoff[0]["notified_at"]}}
+        )
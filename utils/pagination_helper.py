@@ -0,0 +1,47 @@
+import base64
+import json
+
+# Sortable fields, each backed by a (field, brand) index from db.create_indexes.
+# brand is unique, so (field, brand) is a total order for keyset paging.
+SORTABLE_FIELDS = ("brand", "name", "price", "quantity")
+
+
+class InvalidCursor(ValueError):
+    """Raised for cursors that are malformed or were issued for another sort"""
+
+
+def encode_cursor(sort: str, order: int, last_doc: dict) -> str:
+    """Opaque token pointing just past last_doc in (sort, brand) order"""
+    raw = json.dumps({"s": sort, "o": order, "v": last_doc.get(sort), "b": last_doc.get("brand")})
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token: str, sort: str, order: int) -> dict:
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        position = {"value": data["v"], "brand": data["b"]}
+        issued_for = (data["s"], data["o"])
+    except (ValueError, KeyError, TypeError):
+        raise InvalidCursor("Malformed cursor")
+    if issued_for != (sort, order):
+        raise InvalidCursor("Cursor was issued for a different sort")
+    return position
+
+
+def keyset_filter(sort: str, order: int, position: dict) -> dict:
+    """Documents strictly after `position` in (sort, brand) order"""
+    op = "$gt" if order == 1 else "$lt"
+    if sort == "brand":
+        return {"brand": {op: position["brand"]}}
+    return {"$or": [
+        {sort: {op: position["value"]}},
+        {sort: position["value"], "brand": {op: position["brand"]}},
+    ]}
+
+
+def sort_spec(sort: str, order: int):
+    """Sort keys matching the (field, brand) compound indexes"""
+    if sort == "brand":
+        return [("brand", order)]
+    return [(sort, order), ("brand", order)]
@@ -1,9 +1,91 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from passlib.context import CryptContext
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# bcrypt releases the GIL, so a small thread pool keeps it off the event loop
+PASSWORD_WORKERS = int(os.getenv("PASSWORD_WORKERS", min(4, os.cpu_count() or 1)))
+PASSWORD_MAX_PENDING = int(os.getenv("PASSWORD_MAX_PENDING", 32))
+
+_executor = ThreadPoolExecutor(max_workers=PASSWORD_WORKERS, thread_name_prefix="bcrypt")
+_pending = 0
+_stats_lock = threading.Lock()
+_stats = {
+    "completed": 0,
+    "rejected": 0,
+    "hash_seconds_total": 0.0,
+    "hash_seconds_max": 0.0,
+    "queue_wait_seconds_total": 0.0,
+    "queue_wait_seconds_max": 0.0,
+}
+
+
+class PasswordPoolBusy(Exception):
+    """Raised when too many hash/verify jobs are already queued"""
+
+
 def hash_password(password: str):
     return pwd_context.hash(password)
 
 def verify_password(plain_password: str, hashed_password: str):
     return pwd_context.verify(plain_password, hashed_password)
+
+
+def _timed(fn, args, queued_at):
+    started = time.perf_counter()
+    try:
+        return fn(*args)
+    finally:
+        finished = time.perf_counter()
+        wait, work = started - queued_at, finished - started
+        with _stats_lock:
+            _stats["completed"] += 1
+            _stats["queue_wait_seconds_total"] += wait
+            _stats["queue_wait_seconds_max"] = max(_stats["queue_wait_seconds_max"], wait)
+            _stats["hash_seconds_total"] += work
+            _stats["hash_seconds_max"] = max(_stats["hash_seconds_max"], work)
+
+
+def _job_done(future):
+    global _pending
+    with _stats_lock:
+        _pending -= 1
+
+
+async def _run(fn, *args):
+    global _pending
+    with _stats_lock:
+        if _pending >= PASSWORD_MAX_PENDING:
+            _stats["rejected"] += 1
+            raise PasswordPoolBusy()
+        _pending += 1
+    # Counted down when the job itself ends: a cancelled caller leaves a started hash running
+    future = _executor.submit(_timed, fn, args, time.perf_counter())
+    future.add_done_callback(_job_done)
+    return await asyncio.wrap_future(future)
+
+
+async def hash_password_async(password: str):
+    """hash_password on the bcrypt pool; raises PasswordPoolBusy when saturated"""
+    return await _run(hash_password, password)
+
+async def verify_password_async(plain_password: str, hashed_password: str):
+    """verify_password on the bcrypt pool; raises PasswordPoolBusy when saturated"""
+    return await _run(verify_password, plain_password, hashed_password)
+
+
+def password_pool_stats() -> dict:
+    """Queue depth plus hash latency and queue wait for the bcrypt pool"""
+    completed = _stats["completed"]
+    return {
+        "workers": PASSWORD_WORKERS,
+        "max_pending": PASSWORD_MAX_PENDING,
+        "pending": _pending,
+        **_stats,
+        "hash_seconds_avg": round(_stats["hash_seconds_total"] / completed, 6) if completed else 0.0,
+        "queue_wait_seconds_avg": round(_stats["queue_wait_seconds_total"] / completed, 6) if completed else 0.0,
+    }
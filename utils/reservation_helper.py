@@ -0,0 +1,349 @@
+import asyncio
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+from pymongo import ReturnDocument
+from db.db import items_collection, purchases_collection
+from utils.brand_helper import brand_filter, normalize_brand
+from utils.catalog_version import invalidate_catalog_cache
+from utils.inventory_helper import stock_delta, apply_stock_delta
+from utils.notification_helper import record_stock_notifications
+from utils.response_helper import held_units
+from utils.sales_helper import record_sales
+
+# Units pre-claimed from the item document per round trip
+RESERVATION_BLOCK = int(os.getenv("RESERVATION_BLOCK", 20))
+# Sold units are written to Mongo at least this often (seconds)
+RESERVATION_FLUSH_INTERVAL = float(os.getenv("RESERVATION_FLUSH_INTERVAL", 1))
+# A brand with no sales for this long hands its unsold units back
+RESERVATION_IDLE_SECONDS = int(os.getenv("RESERVATION_IDLE_SECONDS", 30))
+# Claims not renewed for this long are treated as abandoned by a dead worker
+RESERVATION_LEASE_SECONDS = int(os.getenv("RESERVATION_LEASE_SECONDS", 120))
+# Brands always served from the ledger, in addition to items flagged hot
+HOT_BRANDS = [b.strip() for b in os.getenv("HOT_BRANDS", "").split(",") if b.strip()]
+
+# Field names in Mongo can't contain dots, so no hostname here
+LEDGER_ID = uuid.uuid4().hex[:12]
+HOT_REFRESH_TICKS = 5  # maintenance ticks between re-reading the hot flags
+# $unset for writes that set quantity outright; ledgers whose reservation is
+# gone drop their unsold units instead of adding them back
+RESET_RESERVATIONS = {"reserved": ""}
+
+
+class _Entry:
+    """Units this process holds for one brand"""
+
+    def __init__(self, brand_key: str):
+        self.brand_key = brand_key
+        self.brand = brand_key  # as the buyer spelled it; settles match with the same filter as claims
+        self.available = 0  # claimed and unsold
+        self.sold = 0  # sold since the last flush
+        self.item = None  # brand/name/created_by/quantity from the last claim or flush
+        self.last_sale = time.monotonic()
+        self.lock = asyncio.Lock()  # one claim, flush or release at a time
+        self.closed = False  # released; buyers move on to a fresh entry
+        self.empty_at = None  # when a claim last came back empty
+
+
+def _claim_pipeline(ledger_id: str, block: int, lease_until: datetime):
+    """Move min(block, quantity) units from quantity into reserved.<ledger>"""
+    mine = f"reserved.{ledger_id}"
+    return [
+        {"$set": {f"{mine}.claimed": {"$min": [block, {"$max": ["$quantity", 0]}]}}},
+        {"$set": {
+            "quantity": {"$subtract": ["$quantity", f"${mine}.claimed"]},
+            f"{mine}.units": {"$add": [{"$ifNull": [f"${mine}.units", 0]}, f"${mine}.claimed"]},
+            f"{mine}.expires_at": lease_until,
+        }},
+    ]
+
+
+class ReservationLedger:
+    """
+    In-process stock for hot brands. Blocks of units are claimed from the item
+    document atomically, so Mongo never counts them as available twice;
+    purchases are served from memory and written back in batches.
+
+    Each worker's ledger only sees its own claims. When an admin sets a
+    quantity outright, the other workers keep selling the blocks they already
+    hold until their next flush finds the reservation gone: at most one block
+    per worker, for up to RESERVATION_FLUSH_INTERVAL. benchmarks/check_oversell
+    measures that window with a second ledger.
+    """
+
+    def __init__(self, ledger_id: str = LEDGER_ID):
+        self.ledger_id = ledger_id
+        self.hot = {normalize_brand(b) for b in HOT_BRANDS}
+        self._entries: dict = {}  # brand_key -> _Entry
+        self.stats = {
+            "claims": 0,
+            "claimed_units": 0,
+            "sold": 0,
+            "flushes": 0,
+            "released_units": 0,
+            "dropped_units": 0,
+            "exhausted": 0,
+        }
+
+    def is_hot(self, brand: str) -> bool:
+        return normalize_brand(brand) in self.hot
+
+    async def buy(self, brand: str):
+        """
+        Take one unit from the ledger and return the item summary, or None when
+        the ledger can't serve it (item missing or out of stock everywhere).
+        """
+        taken, item = await self.take(brand, 1)
+        return item if taken else None
+
+    async def take(self, brand: str, wanted: int):
+        """
+        Take up to `wanted` units, claiming more blocks as needed. Returns
+        (units taken, item summary); the summary is None if none were taken.
+        """
+        key = normalize_brand(brand)
+        taken, item = 0, None
+        while taken < wanted:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _Entry(key)
+            # No await between the check and the decrement, so buyers can't overlap
+            if entry.available > 0 and not entry.closed:
+                units = min(entry.available, wanted - taken)
+                entry.available -= units
+                entry.sold += units
+                entry.last_sale = time.monotonic()
+                self.stats["sold"] += units
+                taken += units
+                item = entry.item
+                continue
+            # Sold out moments ago: skip the claim round trip
+            if entry.empty_at is not None and time.monotonic() - entry.empty_at < RESERVATION_FLUSH_INTERVAL:
+                break
+            async with entry.lock:
+                if entry.available > 0 or entry.closed:
+                    continue
+                if not await self._claim(entry, brand):
+                    break
+        if taken < wanted:
+            self.stats["exhausted"] += 1
+        return taken, item
+
+    async def _claim(self, entry: _Entry, brand: str) -> int:
+        lease_until = datetime.utcnow() + timedelta(seconds=RESERVATION_LEASE_SECONDS)
+        item = await items_collection.find_one_and_update(
+            # Nothing to claim at zero stock; don't write an empty reservation
+            {**brand_filter(brand), "quantity": {"$gt": 0}},
+            _claim_pipeline(self.ledger_id, RESERVATION_BLOCK, lease_until),
+            projection={"_id": 0, "brand": 1, "name": 1, "price": 1, "created_by": 1, "quantity": 1},
+            return_document=ReturnDocument.BEFORE,
+        )
+        entry.empty_at = time.monotonic()
+        if not item:
+            return 0
+        # The pre-image already passed quantity > 0; the pipeline took the same amount
+        claimed = min(RESERVATION_BLOCK, item["quantity"])
+        item["quantity"] -= claimed
+        entry.empty_at = None
+        entry.brand = brand
+        entry.item = item
+        entry.available += claimed
+        self.stats["claims"] += 1
+        self.stats["claimed_units"] += claimed
+        return claimed
+
+    async def flush(self, entry: _Entry):
+        """Write sold units to the item, purchases and notifications"""
+        async with entry.lock:
+            await self._settle(entry, release=False)
+
+    async def release(self, entry: _Entry):
+        """Write sold units and hand every unsold unit back to the item"""
+        async with entry.lock:
+            if entry.closed:
+                return
+            # Closing first stops buyers taking units from this entry mid-release
+            entry.closed = True
+            try:
+                await self._settle(entry, release=True)
+            except BaseException:
+                entry.closed = False
+                raise
+            if self._entries.get(entry.brand_key) is entry:
+                del self._entries[entry.brand_key]
+
+    async def reset(self, brand: str):
+        """
+        Settle this worker's units for a brand before an admin sets its quantity
+        outright. That write also drops every other worker's reservation (see
+        RESET_RESERVATIONS), so no units are handed back on top of the new value;
+        units those workers still hold in memory sell until their next flush.
+        """
+        entry = self._entries.get(normalize_brand(brand))
+        if entry is not None:
+            await self.release(entry)
+
+    def _drop(self, entry: _Entry):
+        """The item no longer holds this worker's units: quantity was reset, or the item deleted"""
+        self.stats["dropped_units"] += entry.available
+        entry.available = 0
+        entry.closed = True
+        if self._entries.get(entry.brand_key) is entry:
+            del self._entries[entry.brand_key]
+
+    async def _settle(self, entry: _Entry, release: bool):
+        sold, units = entry.sold, entry.available if release else 0
+        if not sold and (not release or entry.item is None):
+            return  # nothing sold, and for a release nothing was ever claimed
+        mine = f"reserved.{self.ledger_id}"
+        now = datetime.utcnow()
+        # Every settle changes quantity or held units, so item ETags must move too
+        if release:
+            update = {"$inc": {"quantity": units}, "$unset": {mine: ""}, "$set": {"updated_at": now}}
+        else:
+            update = {"$inc": {f"{mine}.units": -sold},
+                      "$set": {f"{mine}.expires_at": now + timedelta(seconds=RESERVATION_LEASE_SECONDS),
+                               "updated_at": now}}
+        item = await items_collection.find_one_and_update(
+            {**brand_filter(entry.brand), mine: {"$exists": True}},
+            update,
+            projection={"_id": 0, "brand": 1, "name": 1, "price": 1, "created_by": 1, "quantity": 1,
+                        "in_stock": 1, "reserved": 1},
+            return_document=ReturnDocument.AFTER,
+        )
+        # The item write is the one that matters; clear the counters before anything else can fail
+        entry.sold -= sold
+        if item is None:
+            # Sales still count; the unsold units went with the admin's new quantity
+            self._drop(entry)
+        elif release:
+            entry.available -= units
+            self.stats["released_units"] += units
+        if sold:
+            self.stats["flushes"] += 1
+            summary = item or entry.item
+            await purchases_collection.update_one(
+                brand_filter(summary["brand"]),
+                {"$inc": {"quantity_sold": sold}, "$set": {
+                    "brand": summary["brand"], "brand_key": entry.brand_key, "name": summary["name"]
+                }},
+                upsert=True,
+            )
+            await record_sales([(summary["brand"], sold, summary.get("price"))])
+        if item is None or not (sold or units):
+            return
+        entry.item = item
+        remaining = item["quantity"] + held_units(item)
+        in_stock_now = await _sync_in_stock(entry.brand, item, remaining)
+        if sold:
+            await record_stock_notifications(
+                [({**item, "quantity": remaining, "in_stock": in_stock_now}, sold)]
+            )
+        await invalidate_catalog_cache()
+
+    async def set_hot(self, brand: str, hot: bool) -> bool:
+        """Flag an item hot (shared through Mongo) or return its stock to normal buying"""
+        result = await items_collection.update_one(brand_filter(brand), {"$set": {"hot": hot}})
+        if not result.matched_count:
+            return False
+        key = normalize_brand(brand)
+        if hot:
+            self.hot.add(key)
+        else:
+            self.hot.discard(key)
+            entry = self._entries.get(key)
+            if entry is not None:
+                await self.release(entry)
+        return True
+
+    async def refresh_hot(self):
+        flagged = await items_collection.find({"hot": True}, {"_id": 0, "brand_key": 1}).to_list(length=None)
+        hot = {doc["brand_key"] for doc in flagged if doc.get("brand_key")}
+        hot.update(normalize_brand(b) for b in HOT_BRANDS)
+        for key in self.hot - hot:
+            entry = self._entries.get(key)
+            if entry is not None:
+                await self.release(entry)
+        self.hot = hot
+
+    async def tick(self):
+        """Flush pending sales; return stock for idle or no-longer-hot brands"""
+        now = time.monotonic()
+        for entry in list(self._entries.values()):
+            if entry.brand_key not in self.hot or now - entry.last_sale >= RESERVATION_IDLE_SECONDS:
+                await self.release(entry)
+            else:
+                await self.flush(entry)
+
+    async def close(self):
+        """Shutdown: write everything sold and hand back every unsold unit"""
+        for entry in list(self._entries.values()):
+            try:
+                await self.release(entry)
+            except Exception as e:
+                print(f"Reservation release error for {entry.brand_key}: {e}")
+
+    def snapshot(self) -> dict:
+        return {
+            "ledger_id": self.ledger_id,
+            "hot": sorted(self.hot),
+            "held": {key: e.available for key, e in self._entries.items()},
+            "unflushed": {key: e.sold for key, e in self._entries.items() if e.sold},
+            **self.stats,
+        }
+
+
+async def _sync_in_stock(brand: str, item: dict, remaining: int) -> bool:
+    """Keep in_stock (and the inventory counters) in line with stock incl. reservations"""
+    in_stock_now = remaining > 0
+    if in_stock_now != item.get("in_stock"):
+        flipped = await items_collection.update_one(
+            {**brand_filter(brand), "in_stock": {"$ne": in_stock_now}},
+            {"$set": {"in_stock": in_stock_now, "updated_at": datetime.utcnow()}},
+        )
+        if flipped.modified_count:
+            await apply_stock_delta(stock_delta(not in_stock_now, in_stock_now))
+    return in_stock_now
+
+
+reservation_ledger = ReservationLedger()
+
+
+async def maintain_reservations(interval: float = RESERVATION_FLUSH_INTERVAL):
+    """Periodic flush/release for the ledger, and pick up hot flags set by other workers"""
+    ticks = 0
+    while True:
+        try:
+            if ticks % HOT_REFRESH_TICKS == 0:
+                await reservation_ledger.refresh_hot()
+            await reservation_ledger.tick()
+        except Exception as e:
+            print(f"Reservation ledger error: {e}")
+        ticks += 1
+        await asyncio.sleep(interval)
+
+
+async def release_expired_reservations() -> dict:
+    """
+    Return units held by ledgers whose lease lapsed (a worker that died).
+    Sales that worker served but never flushed are unknown, so this is an
+    explicit admin action: running it can re-sell those units.
+    """
+    now = datetime.utcnow()
+    released = {}
+    cursor = items_collection.find({"reserved": {"$exists": True}}, {"_id": 1, "brand_key": 1, "reserved": 1})
+    async for item in cursor:
+        for ledger, held in (item.get("reserved") or {}).items():
+            if ledger == reservation_ledger.ledger_id or held.get("expires_at", now) >= now:
+                continue
+            field = f"reserved.{ledger}"
+            result = await items_collection.update_one(
+                {"_id": item["_id"], f"{field}.expires_at": held["expires_at"]},
+                {"$inc": {"quantity": held.get("units", 0)}, "$unset": {field: ""}, "$set": {"updated_at": now}},
+            )
+            if result.modified_count:
+                released[item.get("brand_key")] = released.get(item.get("brand_key"), 0) + held.get("units", 0)
+    if released:
+        await invalidate_catalog_cache()
+    return released
@@ -0,0 +1,92 @@
+from typing import Any, Optional
+from starlette.responses import Response
+
+try:
+    import orjson
+except ImportError:  # plain json keeps the fast path working, just slower
+    orjson = None
+    import json
+
+# Fields and defaults of main.Item; DB projections limited to these are
+# already in response shape and can skip pydantic revalidation.
+ITEM_FIELDS = {
+    "brand": None,
+    "name": None,
+    "price": None,
+    "quantity": None,
+    "description": None,
+    "in_stock": True,
+    "created_by": None,
+    "image_id": None,
+}
+# reserved: units hot-brand ledgers claimed, which are still for sale
+ITEM_PROJECTION = {"_id": 0, **{field: 1 for field in ITEM_FIELDS}, "reserved": 1}
+
+
+def held_units(doc: dict) -> int:
+    """Units claimed from an item by reservation ledgers and not yet sold"""
+    return sum(held.get("units", 0) for held in (doc.get("reserved") or {}).values())
+
+
+def with_held(doc: dict) -> dict:
+    """Fold ledger-held units back into a raw item document's quantity"""
+    held = held_units(doc)
+    doc.pop("reserved", None)
+    if held and "quantity" in doc:
+        doc["quantity"] += held
+    return doc
+
+
+def item_view(doc: dict) -> dict:
+    """Shape a trusted item projection like the Item model, without validation"""
+    view = {field: doc.get(field, default) for field, default in ITEM_FIELDS.items()}
+    if view["quantity"] is not None:
+        view["quantity"] += held_units(doc)
+    if isinstance(view["price"], int):
+        view["price"] = float(view["price"])  # Item.price is a float
+    return view
+
+
+def dumps(content: Any) -> str:
+    """Encode to a JSON string; datetimes become ISO strings"""
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS).decode()
+    return json.dumps(content, default=str, separators=(",", ":"))
+
+
+class FastJSONResponse(Response):
+    """JSON response for content that is already response-shaped or pre-encoded"""
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, bytes):
+            return content
+        if isinstance(content, str):
+            return content.encode("utf-8")
+        return dumps(content).encode("utf-8")
+
+
+def etag_matches(if_none_match: Optional[str], etag: Optional[str]) -> bool:
+    """If-None-Match check; uses weak comparison, as the header requires"""
+    if not if_none_match or not etag:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+def etag_headers(etag: Optional[str]) -> dict:
+    # no-cache: clients may store the body but must revalidate every time
+    return {"ETag": etag, "Cache-Control": "no-cache"} if etag else {}
+
+
+def not_modified(etag: str) -> Response:
+    """Empty 304 carrying the validator the client already holds"""
+    return Response(status_code=304, headers=etag_headers(etag))
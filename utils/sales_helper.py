@@ -0,0 +1,152 @@
+import asyncio
+import os
+from datetime import datetime, timedelta
+from pymongo import UpdateOne
+from db.db import sales_buckets_collection
+from db.migrations import single_runner
+from utils.brand_helper import normalize_brand
+
+# Closed hours older than this are compacted from minute buckets into hour buckets
+SALES_ROLLUP_GRACE = int(os.getenv("SALES_ROLLUP_GRACE", 300))
+SALES_ROLLUP_INTERVAL = int(os.getenv("SALES_ROLLUP_INTERVAL", 300))
+SALES_GRANULARITIES = ("minute", "hour", "day")
+SALES_METRICS = ("units", "revenue", "charged_units", "charged_revenue")
+
+# Stock sold through buy/checkout vs. amounts recorded by /payments/charge
+_SOURCE_FIELDS = {
+    "sale": ("units", "revenue"),
+    "charge": ("charged_units", "charged_revenue"),
+}
+
+
+def _floor(moment: datetime, granularity: str) -> datetime:
+    if granularity == "minute":
+        return moment.replace(second=0, microsecond=0)
+    if granularity == "hour":
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+async def record_sales(lines, source: str = "sale"):
+    """
+    $inc the current minute bucket for each (brand, units, unit_price) line.
+    Analytics never fail the sale that feeds them, so errors are only logged.
+    """
+    units_field, revenue_field = _SOURCE_FIELDS[source]
+    start = _floor(datetime.utcnow(), "minute")
+    merged = {}
+    for brand, units, price in lines:
+        if units <= 0:
+            continue
+        key = normalize_brand(brand)
+        _, total_units, total_revenue = merged.get(key, (brand, 0, 0.0))
+        merged[key] = (brand, total_units + units, total_revenue + units * float(price or 0))
+    if not merged:
+        return
+    ops = [
+        UpdateOne(
+            {"granularity": "minute", "brand_key": key, "start": start},
+            {"$inc": {units_field: units, revenue_field: round(revenue, 2)}, "$set": {"brand": brand}},
+            upsert=True,
+        )
+        for key, (brand, units, revenue) in merged.items()
+    ]
+    try:
+        await sales_buckets_collection.bulk_write(ops, ordered=False)
+    except Exception as e:
+        print(f"Sales bucket write error: {e}")
+
+
+async def rollup_sales(now: datetime = None) -> dict:
+    """
+    Compact minute buckets of closed hours into hour buckets. One worker runs
+    it at a time. The amounts read are $inc'ed into the hours and then taken
+    off exactly the minute buckets they came from; a bucket that got a late
+    sale in between keeps the remainder for the next run.
+    """
+    async with single_runner("sales_rollup") as lease:
+        if lease is None:
+            return {"hours": 0, "minutes_removed": 0, "skipped": True}
+        return await _rollup(now or datetime.utcnow())
+
+
+async def _rollup(now: datetime) -> dict:
+    cutoff = _floor(now - timedelta(seconds=SALES_ROLLUP_GRACE), "hour")
+    hours = {}
+    minutes = []
+    cursor = sales_buckets_collection.find({"granularity": "minute", "start": {"$lt": cutoff}})
+    async for doc in cursor:
+        hour = (doc["brand_key"], _floor(doc["start"], "hour"))
+        bucket = hours.setdefault(hour, {"brand": doc.get("brand"), **{m: 0 for m in SALES_METRICS}})
+        read = {m: doc.get(m, 0) for m in SALES_METRICS}
+        for metric in SALES_METRICS:
+            bucket[metric] += read[metric]
+        minutes.append((doc["_id"], read))
+    if not hours:
+        return {"hours": 0, "minutes_removed": 0}
+
+    await sales_buckets_collection.bulk_write([
+        UpdateOne(
+            {"granularity": "hour", "brand_key": brand_key, "start": start},
+            {"$inc": {m: round(bucket[m], 2) if "revenue" in m else bucket[m] for m in SALES_METRICS},
+             "$set": {"brand": bucket["brand"]}},
+            upsert=True,
+        )
+        for (brand_key, start), bucket in hours.items()
+    ], ordered=False)
+    await sales_buckets_collection.bulk_write([
+        UpdateOne({"_id": _id}, {"$inc": {m: -v for m, v in read.items()}})
+        for _id, read in minutes
+    ], ordered=False)
+    removed = await sales_buckets_collection.delete_many(
+        {"_id": {"$in": [_id for _id, _ in minutes]}, **{m: 0 for m in SALES_METRICS}}
+    )
+    return {"hours": len(hours), "minutes_removed": removed.deleted_count}
+
+
+async def maintain_sales_rollups(interval: int = SALES_ROLLUP_INTERVAL):
+    while True:
+        try:
+            await rollup_sales()
+        except Exception as e:
+            print(f"Sales rollup error: {e}")
+        await asyncio.sleep(interval)
+
+
+async def query_sales(start: datetime, end: datetime, granularity: str = "hour", brand: str = None) -> dict:
+    """
+    Merge hour buckets (compacted history) and minute buckets (recent sales)
+    into `granularity` points over [start, end). Points for compacted hours
+    are never finer than an hour.
+    """
+    query = {"start": {"$gte": _floor(start, "hour"), "$lt": end}}
+    if brand:
+        query["brand_key"] = normalize_brand(brand)
+    points = {}
+    totals = {m: 0 for m in SALES_METRICS}
+    cursor = sales_buckets_collection.find(
+        {"granularity": {"$in": ["hour", "minute"]}, **query}, {"_id": 0}
+    )
+    async for doc in cursor:
+        # Minute buckets before `start` came in only because of the hour-aligned bound
+        if doc["granularity"] == "minute" and doc["start"] < start:
+            continue
+        # Never report finer than the bucket itself
+        width = granularity if doc["granularity"] == "minute" or granularity == "day" else "hour"
+        point = points.setdefault(_floor(doc["start"], width), {m: 0 for m in SALES_METRICS})
+        for metric in SALES_METRICS:
+            point[metric] += doc.get(metric, 0)
+            totals[metric] += doc.get(metric, 0)
+
+    buckets = [
+        {"start": moment, **{m: round(v, 2) if "revenue" in m else v for m, v in values.items()}}
+        for moment, values in sorted(points.items())
+    ]
+    return {
+        "brand": brand,
+        "granularity": granularity,
+        "start": start,
+        "end": end,
+        "buckets": buckets,
+        "totals": {m: round(v, 2) if "revenue" in m else v for m, v in totals.items()},
+    }
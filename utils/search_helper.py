@@ -1,9 +1,203 @@
-from db.db import items_collection
+import asyncio
+import heapq
+import os
+import re
+from db.db import items_collection, catalog_items_collection
+from utils.brand_helper import normalize_brand
+from utils.response_helper import with_held
+
+# Rebuild interval for the typeahead index; picks up writes made by other workers
+SEARCH_INDEX_REFRESH = int(os.getenv("SEARCH_INDEX_REFRESH", 60))
+# Broader queries than this go to Mongo instead of becoming a huge $in filter
+SEARCH_MAX_BRANDS = int(os.getenv("SEARCH_MAX_BRANDS", 300))
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
 
 async def mongo_text_search(query: str):
-    cursor = items_collection.find(
+    cursor = catalog_items_collection.find(
         {"$text": {"$search": query}},
         {"_id": 0, "score": {"$meta": "textScore"}}  # include score
     ).sort([("score", {"$meta": "textScore"})])     # sort by relevance
-    
-    return await cursor.to_list(length=100)
+
+    return [with_held(doc) for doc in await cursor.to_list(length=100)]
+
+
+def _tokenize(text) -> list:
+    if not isinstance(text, str):
+        return []
+    return [word.casefold() for word in _WORD.findall(text)]
+
+
+class PrefixIndex:
+    """
+    In-process typeahead index over item brand, name and description.
+    Word prefixes answer as-you-type queries; trigrams add infix matches.
+    """
+
+    # Field weights used for ranking
+    FIELDS = (("brand", 3.0), ("name", 2.0), ("description", 1.0))
+    MAX_PREFIX = 12
+
+    def __init__(self):
+        self._reset()
+        self.ready = False
+        self._replay = None  # writes seen while a rebuild is reading Mongo
+
+    def _reset(self):
+        self._docs = {}  # brand_key -> summary shown in suggestions
+        self._words = {}  # brand_key -> {field: set(words)}
+        self._prefixes = {}  # prefix -> {brand_key: best field weight}
+        self._grams = {}  # trigram -> set(brand_key)
+
+    def __len__(self):
+        return len(self._docs)
+
+    def upsert(self, item: dict):
+        """Index (or re-index) one item document"""
+        if self._replay is not None:
+            self._replay.append(("upsert", item))
+        self._upsert(item)
+
+    def remove(self, brand: str):
+        """Drop an item by brand"""
+        if self._replay is not None:
+            self._replay.append(("remove", brand))
+        self._remove(normalize_brand(brand))
+
+    def _upsert(self, item: dict):
+        key = normalize_brand(item["brand"])
+        self._remove(key)
+        self._docs[key] = {
+            "brand": item["brand"],
+            "name": item.get("name"),
+            "price": item.get("price"),
+        }
+        words = {field: set(_tokenize(item.get(field))) for field, _ in self.FIELDS}
+        self._words[key] = words
+        for field, weight in self.FIELDS:
+            for word in words[field]:
+                for end in range(1, min(len(word), self.MAX_PREFIX) + 1):
+                    holders = self._prefixes.setdefault(word[:end], {})
+                    if holders.get(key, 0) < weight:
+                        holders[key] = weight
+                for start in range(len(word) - 2):
+                    self._grams.setdefault(word[start:start + 3], set()).add(key)
+
+    def _remove(self, key: str):
+        words = self._words.pop(key, None)
+        self._docs.pop(key, None)
+        if not words:
+            return
+        for word in set().union(*words.values()):
+            for end in range(1, min(len(word), self.MAX_PREFIX) + 1):
+                holders = self._prefixes.get(word[:end])
+                if holders is not None:
+                    holders.pop(key, None)
+                    if not holders:
+                        del self._prefixes[word[:end]]
+            for start in range(len(word) - 2):
+                gram = word[start:start + 3]
+                holders = self._grams.get(gram)
+                if holders is not None:
+                    holders.discard(key)
+                    if not holders:
+                        del self._grams[gram]
+
+    def _match_term(self, term: str) -> dict:
+        """brand_key -> score for one query word"""
+        scores = {}
+        for key, weight in self._prefixes.get(term[:self.MAX_PREFIX], {}).items():
+            words = self._words[key]
+            # Long terms are truncated in the prefix map, so confirm the full match
+            if len(term) > self.MAX_PREFIX and not any(
+                w.startswith(term) for field, _ in self.FIELDS for w in words[field]
+            ):
+                continue
+            exact = any(term in words[field] for field, _ in self.FIELDS)
+            scores[key] = weight * (1.5 if exact else 1.0)
+        if len(term) >= 3:
+            grams = [self._grams.get(term[i:i + 3], set()) for i in range(len(term) - 2)]
+            for key in set.intersection(*grams) - scores.keys():
+                words = self._words[key]
+                best = max(
+                    (weight for field, weight in self.FIELDS if any(term in w for w in words[field])),
+                    default=0,
+                )
+                if best:
+                    scores[key] = best * 0.3
+        return scores
+
+    def search(self, query: str, limit: int = 10) -> list:
+        """Ranked suggestions; every query word must match some field"""
+        scores = None
+        for term in dict.fromkeys(_tokenize(query)):
+            term_scores = self._match_term(term)
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {key: scores[key] + s for key, s in term_scores.items() if key in scores}
+            if not scores:
+                return []
+        if not scores:
+            return []
+        best = heapq.nsmallest(limit, scores.items(), key=lambda kv: (-kv[1], len(kv[0]), kv[0]))
+        return [{**self._docs[key], "score": round(score, 2)} for key, score in best]
+
+    def matching_brands(self, query: str, limit: int = SEARCH_MAX_BRANDS):
+        """
+        Every brand matching the query, for use as a Mongo $in filter, or None
+        when more than `limit` match (a short prefix) and the caller should
+        filter in Mongo instead.
+        """
+        brands = [doc["brand"] for doc in self.search(query, limit=limit + 1)]
+        return brands if len(brands) <= limit else None
+
+    async def rebuild(self):
+        """Reload every item from Mongo; writes made meanwhile are replayed"""
+        self._replay = []
+        try:
+            items = await items_collection.find(
+                {}, {"_id": 0, "brand": 1, "name": 1, "price": 1, "description": 1}
+            ).to_list(length=None)
+        except BaseException:
+            self._replay = None
+            raise
+        replay, self._replay = self._replay, None
+        self._reset()
+        for item in items:
+            if isinstance(item.get("brand"), str):
+                self._upsert(item)
+        for op, arg in replay:
+            if op == "upsert":
+                self._upsert(arg)
+            else:
+                self._remove(normalize_brand(arg))
+        self.ready = True
+
+
+item_search_index = PrefixIndex()
+
+
+async def maintain_search_index(interval: int = SEARCH_INDEX_REFRESH):
+    """Build the typeahead index, then refresh it periodically"""
+    while True:
+        try:
+            await item_search_index.rebuild()
+        except Exception as e:
+            print(f"Search index rebuild error: {e}")
+        await asyncio.sleep(interval)
+
+
+async def suggest_items(query: str, limit: int = 10) -> list:
+    """Typeahead suggestions; falls back to an indexed brand prefix scan until the index is built"""
+    if item_search_index.ready:
+        return item_search_index.search(query, limit)
+    prefix = normalize_brand(query.strip())
+    if not prefix:
+        return []
+    cursor = items_collection.find(
+        {"brand_key": {"$regex": f"^{re.escape(prefix)}"}},
+        {"_id": 0, "brand": 1, "name": 1, "price": 1}
+    ).sort("brand_key", 1).limit(limit)
+    return await cursor.to_list(length=limit)
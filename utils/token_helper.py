@@ -1,10 +1,17 @@
 from jose import jwt, JWTError
 import os
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
 
 SECRET_KEY = os.getenv("SECRET_KEY", "secret")
 ALGORITHM = "HS256"
 TOKEN_EXPIRE_HOURS = int(os.getenv("TOKEN_EXPIRE_HOURS", "1"))
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "1024"))
+
+# Already-verified tokens -> payload, kept until the token's own exp
+_verified_tokens: "OrderedDict[str, dict]" = OrderedDict()
+token_cache_stats = {"hits": 0, "misses": 0}
 
 def create_token(data: dict):
     to_encode = data.copy()
@@ -13,7 +20,21 @@ def create_token(data: dict):
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 def decode_token(token: str):
+    payload = _verified_tokens.get(token)
+    if payload is not None:
+        if payload.get("exp", 0) > time.time():
+            _verified_tokens.move_to_end(token)
+            token_cache_stats["hits"] += 1
+            return dict(payload)
+        del _verified_tokens[token]
+    token_cache_stats["misses"] += 1
+
     try:
-        return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
     except JWTError:
         return None
+    if "exp" in payload:
+        _verified_tokens[token] = payload
+        while len(_verified_tokens) > TOKEN_CACHE_SIZE:
+            _verified_tokens.popitem(last=False)
+    return dict(payload)